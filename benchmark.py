@@ -0,0 +1,338 @@
+"""Load and micro-benchmarks against a synthetic store database.
+
+Run: python benchmark.py --stores 10000 --requests 300 --concurrency 16 --out bench.json
+Compare: python benchmark.py --stores 10000 --baseline bench.json
+
+Everything runs locally: the database is generated in a temporary directory,
+the Together API and the geocoder are stub_servers.py stubs with tunable
+latency, and the API is driven in-process over ASGI, so the numbers measure
+this code rather than the network.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from opening_hours import ALL_WEEK, Intervals, encode_hours, format_hours, parse_hours
+from stub_servers import StubGeocoderHandler, StubLLMHandler, start_server, stub_url
+
+# (city, first postcode, last postcode, latitude, longitude, spread in degrees, share of stores)
+CITIES = [
+    ("Kuala Lumpur", 50000, 60000, 3.139, 101.687, 0.08, 20),
+    ("Petaling Jaya", 46000, 47800, 3.107, 101.607, 0.04, 8),
+    ("Shah Alam", 40000, 40470, 3.073, 101.518, 0.05, 6),
+    ("Subang Jaya", 47500, 47650, 3.049, 101.585, 0.03, 5),
+    ("Putrajaya", 62000, 62988, 2.926, 101.696, 0.03, 2),
+    ("Seremban", 70000, 70450, 2.726, 101.938, 0.05, 3),
+    ("Melaka", 75000, 75460, 2.189, 102.250, 0.05, 4),
+    ("Johor Bahru", 80000, 81300, 1.492, 103.741, 0.08, 10),
+    ("Ipoh", 30000, 31650, 4.597, 101.090, 0.06, 5),
+    ("George Town", 10000, 11000, 5.414, 100.329, 0.05, 8),
+    ("Alor Setar", 5000, 5460, 6.121, 100.367, 0.04, 3),
+    ("Kota Bharu", 15000, 16150, 6.125, 102.238, 0.04, 3),
+    ("Kuala Terengganu", 20000, 21810, 5.330, 103.137, 0.04, 3),
+    ("Kuantan", 25000, 26100, 3.807, 103.326, 0.05, 4),
+    ("Kota Kinabalu", 88000, 88450, 5.980, 116.073, 0.06, 6),
+    ("Kuching", 93000, 93350, 1.553, 110.359, 0.06, 6),
+]
+STREET_WORDS = ["Bukit", "Taman", "Sri", "Damai", "Jaya", "Indah", "Utama", "Perdana", "Melati",
+                "Cempaka", "Mawar", "Setia", "Bintang", "Sentosa", "Permai", "Harmoni", "Bestari"]
+# Feature frequencies in the scraped Kuala Lumpur data
+FEATURE_RATES = {
+    "has_birthday_party": 0.78, "has_breakfast": 0.86, "has_cashless": 1.0, "has_dessert_center": 0.24,
+    "has_digital_kiosk": 0.98, "has_mccafe": 0.88, "has_wifi": 0.76, "has_mcdelivery": 0.6,
+}
+ALL_DAY_RATE = 0.4
+# Hours for the rest (any not listed are unknown, like "N/A" in the scrape)
+PART_DAY_HOURS = {"Daily 07:00-23:00": 0.35, "Mon-Thu 07:00-24:00; Fri-Sun 07:00-02:00": 0.15}
+MISSING_COORDINATES_RATE = 0.02  # Rows the geocoder backfill has to fix
+
+RULE_QUERIES = [
+    "24 hour stores in KL", "mccafe in bangsar", "wifi without breakfast", "outlets in johor bahru",
+    "birthday party or dessert in petaling jaya", "stores in 55100", "delivery in kuching",
+    "open now in shah alam", "mccafe open at 2am",
+]
+SEMANTIC_QUERIES = ["somewhere to work with coffee near Bangsar", "late night ice cream in penang",
+                    "kids party place shah alam"]
+
+
+# ========== SYNTHETIC DATA ==========
+def synthetic_hours(rng: random.Random) -> Optional[Intervals]:
+    draw = rng.random()
+    if draw < ALL_DAY_RATE:
+        return ALL_WEEK
+    for text, rate in PART_DAY_HOURS.items():
+        draw -= rate
+        if draw < ALL_DAY_RATE:
+            return parse_hours(text)
+    return None
+
+
+def synthetic_stores(count: int, seed: int = 0) -> List[Tuple]:
+    """``count`` store rows shaped like webscrape_p1.parse_store output"""
+    rng = random.Random(seed)
+    weights = [city[6] for city in CITIES]
+    rows = []
+    for i in range(count):
+        city, first, last, lat, lng, spread, _ = rng.choices(CITIES, weights)[0]
+        lat = round(rng.gauss(lat, spread), 6)
+        lng = round(rng.gauss(lng, spread), 6)
+        street = f"Jalan {rng.choice(STREET_WORDS)} {rng.choice(STREET_WORDS)} {rng.randint(1, 30)}"
+        area = f"Taman {rng.choice(STREET_WORDS)}"
+        address = f"Lot {rng.randint(1, 9999)}, {street}, {rng.randint(first, last):05d}, {area}, {city}, Malaysia"
+        name = f"McDonald's {area} {city} {i}" + (" DT" if rng.random() < 0.3 else "")
+        if rng.random() < MISSING_COORDINATES_RATE:
+            lat = lng = "N/A"
+        waze_link = f"https://waze.com/ul?ll={lat},{lng}" if lat != "N/A" else "Location not available"
+        hours = synthetic_hours(rng)
+        features = tuple(int(rng.random() < rate) for rate in FEATURE_RATES.values())
+        rows.append((name, address, lat, lng, format_hours(hours), waze_link, f"03-{rng.randint(20000000, 99999999)}",
+                     f"s{i:05d}@my.mcd.com") + features + (encode_hours(hours),))
+    return rows
+
+
+def mutate(rows: List[Tuple], fraction: float, seed: int = 1) -> List[Tuple]:
+    """Copy of ``rows`` with ``fraction`` of them changed, for differential sync runs"""
+    rng = random.Random(seed)
+    changed = list(rows)
+    for i in rng.sample(range(len(rows)), int(len(rows) * fraction)):
+        row = list(changed[i])
+        hours = None if row[4] == "24 Hours" else ALL_WEEK
+        row[4], row[-1] = format_hours(hours), encode_hours(hours)
+        row[13] = 1 - row[13]
+        changed[i] = tuple(row)
+    return changed
+
+
+# ========== MEASUREMENT ==========
+def summarize(latencies_ms: List[float], elapsed_s: float, errors: int = 0) -> Dict:
+    """Throughput and latency percentiles for one scenario"""
+    values = np.array(latencies_ms) if latencies_ms else np.zeros(1)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "requests": len(latencies_ms),
+        "errors": errors,
+        "throughput_rps": round(len(latencies_ms) / elapsed_s, 1) if elapsed_s else 0.0,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def timed(step: Callable, *args, **kwargs) -> Tuple[float, object]:
+    started = time.perf_counter()
+    result = step(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+async def drive(client, paths: Callable[[int], str], requests: int, concurrency: int) -> Dict:
+    """Issue ``requests`` GETs with ``concurrency`` in flight; the first (cache warm-up) is reported apart"""
+    started = time.perf_counter()
+    warmup = await client.get(paths(0))
+    warmup_ms = (time.perf_counter() - started) * 1000
+
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(1, requests + 1))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            sent = time.perf_counter()
+            response = await client.get(paths(i))
+            latencies.append((time.perf_counter() - sent) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = summarize(latencies, time.perf_counter() - started, errors)
+    result["warmup_ms"] = round(warmup_ms, 3)
+    result["warmup_status"] = warmup.status_code
+    return result
+
+
+# ========== SUITES ==========
+def run_ingest(rows: List[Tuple], geocoder_url: str) -> Dict:
+    """Bulk insert, differential sync and geocoding backfill of the synthetic rows"""
+    from geocoding_p2 import run_pipeline
+    from webscrape_p1 import bulk_store_data, create_database, sync_stores
+
+    results = {}
+    elapsed, _ = timed(create_database)
+    results["create_database"] = {"seconds": round(elapsed, 3)}
+
+    elapsed, inserted = timed(bulk_store_data, rows)
+    results["bulk_insert"] = {"rows": inserted, "seconds": round(elapsed, 3),
+                              "rows_per_second": round(inserted / elapsed, 1)}
+
+    changed = mutate(rows, 0.01)
+    elapsed, stats = timed(sync_stores, changed)
+    results["sync_1pct_changed"] = {**stats, "seconds": round(elapsed, 3),
+                                    "rows_per_second": round(len(rows) / elapsed, 1)}
+
+    stats = run_pipeline(missing_only=True, url=geocoder_url, verbose=False)
+    results["geocode_missing"] = stats
+
+    # Columnar exports span many chunks here, which single-chunk test data never does
+    from export_stores import COLUMNAR_FORMATS, write_columnar
+    for fmt in COLUMNAR_FORMATS:
+        try:
+            elapsed, exported = timed(write_columnar, f"stores.{fmt}", fmt)
+        except RuntimeError as e:  # pyarrow not installed
+            print(f"Skipping {fmt} export: {e}")
+            continue
+        if exported != len(rows):
+            raise RuntimeError(f"{fmt} export wrote {exported} of {len(rows)} stores")
+        results[f"export_{fmt}"] = {"rows": exported, "seconds": round(elapsed, 3)}
+    return results
+
+
+def api_scenarios(store_count: int) -> Dict[str, Callable[[int], str]]:
+    """Scenario name -> function from request number to request path"""
+    rng = random.Random(2)
+    boxes = []
+    for _ in range(64):
+        _, _, _, lat, lng, spread, _ = rng.choice(CITIES)
+        boxes.append(f"{lat - spread:.4f},{lng - spread:.4f},{lat + spread:.4f},{lng + spread:.4f}")
+    points = [(rng.choice(CITIES)[3] + rng.uniform(-0.05, 0.05), rng.choice(CITIES)[4]) for _ in range(64)]
+
+    def tile(i: int) -> str:
+        from store_tiles import world_pixel
+        z = (10, 12, 14, 17)[i % 4]
+        city = CITIES[i % len(CITIES)]
+        x, y = world_pixel(city[3], city[4], z)
+        return f"/stores/tiles/{z}/{int(x // 256)}/{int(y // 256)}"
+
+    return {
+        "stores_full": lambda i: "/stores",
+        "stores_bbox": lambda i: f"/stores?bbox={boxes[i % len(boxes)]}&fields=id,name,latitude,longitude&limit=200",
+        "stores_open_now": lambda i: f"/stores?bbox={boxes[i % len(boxes)]}&open_at=now&fields=id,name&limit=200",
+        "stores_nearby": lambda i: "/stores/nearby?lat={:.5f}&lng={:.5f}&k=10".format(*points[i % len(points)]),
+        "stores_tiles": tile,
+        # Runs first so its index build is the warm-up, not a fallback inside chatbot_rules
+        "chatbot_semantic": lambda i: f"/chatbot/?mode=semantic&query={SEMANTIC_QUERIES[i % len(SEMANTIC_QUERIES)]}",
+        "chatbot_rules": lambda i: f"/chatbot/?query={RULE_QUERIES[i % len(RULE_QUERIES)]}",
+        # Unique wording so every request misses the SQL cache and goes to the LLM stub
+        "chatbot_llm": lambda i: f"/chatbot/?mode=sql&query=recommend a nice outlet variant {i} please",
+    }
+
+
+async def run_api(requests: int, concurrency: int, store_count: int, only: Optional[List[str]]) -> Dict:
+    import httpx
+    from fastapi_p3 import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for name, paths in api_scenarios(store_count).items():
+            if only and name not in only:
+                continue
+            results[name] = await drive(client, paths, requests, concurrency)
+            print(f"{name}: {results[name]['throughput_rps']} req/s, p50 {results[name]['p50_ms']} ms, "
+                  f"p99 {results[name]['p99_ms']} ms")
+    return results
+
+
+# ========== REPORT ==========
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.1) -> List[str]:
+    """Lines describing scenarios whose p95 got worse than the baseline by more than ``threshold``"""
+    regressions = []
+    for name, stats in current.get("api", {}).items():
+        before = baseline.get("api", {}).get(name)
+        if before and before["p95_ms"] and stats["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+    return regressions
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest and the API against synthetic stores")
+    parser.add_argument("--stores", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per API scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--geocoder-latency-ms", type=float, default=20)
+    parser.add_argument("--scenario", action="append", dest="scenarios", help="Only run these API scenarios")
+    parser.add_argument("--skip-ingest", action="store_true", help="Load the rows without timing ingest")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare p95 latencies against")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    llm = start_server(StubLLMHandler, latency_ms=args.llm_latency_ms)
+    geocoder = start_server(StubGeocoderHandler, latency_ms=args.geocoder_latency_ms)
+
+    # The app modules read these at import time, and DB_NAME is relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="mcd-bench-")
+    os.chdir(workdir)
+    os.environ.update({
+        "TOGETHER_API_KEY": os.environ.get("TOGETHER_API_KEY", "benchmark"),
+        "TOGETHER_API_URL": stub_url(llm, "/v1/completions"),
+        "GEOCODE_URL": stub_url(geocoder, "/maps/api/geocode/json"),
+        "GOOGLE_API_KEY": "benchmark",
+        "CHATBOT_CACHE_DB": os.path.join(workdir, "chatbot_cache.db"),
+        "GEOCODE_CACHE_DB": os.path.join(workdir, "geocode_cache.db"),
+    })
+
+    print(f"Generating {args.stores} stores in {workdir}")
+    rows = synthetic_stores(args.stores, args.seed)
+    if args.skip_ingest:
+        from webscrape_p1 import bulk_store_data, create_database
+        create_database()
+        bulk_store_data(rows)
+        ingest = {}
+    else:
+        ingest = run_ingest(rows, os.environ["GEOCODE_URL"])
+
+    api = asyncio.run(run_api(args.requests, args.concurrency, args.stores, args.scenarios))
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stores": args.stores,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "geocoder_latency_ms": args.geocoder_latency_ms,
+            "seed": args.seed,
+        },
+        "ingest": ingest,
+        "api": api,
+    }
+    with open(out, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {out}")
+
+    if baseline:
+        with open(baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file))
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,68 @@
+import asyncio
+import hashlib
+import json
 import os
+import re
 import sqlite3
-import together
-from fastapi import APIRouter, Query, HTTPException
-from typing import List, Dict
+from fastapi import APIRouter, Body, Query, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
+from sql_cache import canonicalize_query, sql_cache
+from intent_parser import compile_intent, confident_intent, rule_based_sql
+from opening_hours import decode_hours, is_open, week_minute
+from llm_client import LLM_MAX_CONCURRENCY, AsyncLLMClient, LLMOverloaded, LLMTimeout
+from sql_sandbox import MAX_ROWS, QueryAborted, QueryRejected, sql_sandbox
+from db import pool_stats, writer
+from metrics import span
+from store_table import match_intent
+from vector_index import semantic_search
 
 # Load environment variables
 from dotenv import load_dotenv
 
 load_dotenv()
-together.api_key = os.getenv("TOGETHER_API_KEY")
-if not together.api_key:
-    raise HTTPException(status_code=500, detail="Together.AI API key not configured")
+TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+if not TOGETHER_API_KEY:
+    # Not fatal: the parser, store table and semantic search still answer without the LLM
+    print("TOGETHER_API_KEY is not set; questions that need the LLM will fall back to local search")
+NO_API_KEY_ERROR = "Error: Together.AI API key not configured"
 
 MODEL_NAME = "meta-llama/Llama-2-70b-hf"
 
+# Shared async client for the chatbot endpoints
+llm_client = AsyncLLMClient(TOGETHER_API_KEY)
+
 # Initialize FastAPI Router
 router = APIRouter(prefix="/chatbot", tags=["Chatbot"])
 
 # ========== DATABASE FUNCTIONS ==========
-def get_db_connection():
-    """Create and return a database connection"""
-    conn = sqlite3.connect("mcdonalds_stores.db")
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def execute_sql_query(sql_query: str) -> List[Dict]:
+def execute_sql_query(sql_query: str, params: Tuple = ()) -> List[Dict]:
     """Execute an SQL query and return results as a list of dictionaries"""
-    if not sql_query.lower().startswith("select"):
-        return [{"error": "Invalid query"}]
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
+    # Generated SQL runs read-only, allowlisted, row-capped and time-bounded
     try:
-        cursor.execute(sql_query)
-        results = [dict(row) for row in cursor.fetchall()]
+        return sql_sandbox.run(sql_query, params)
+    except QueryRejected:
+        return [{"error": "Invalid query"}]
     except Exception as e:
-        results = [{"error": str(e)}]
+        return [{"error": str(e)}]
 
-    conn.close()
-    return results
+def iter_sql_rows(sql_query: str, params: Tuple = (), chunk_size: int = 50) -> Iterator[List[Dict]]:
+    """Run a SELECT and yield result rows in chunks as they come off the cursor"""
+    return sql_sandbox.iter_chunks(sql_query, params, chunk_size)
 
 # ========== LLM-GENERATED SQL QUERY ==========
-def generate_sql_query(user_query: str) -> str:
-    """Use Llama-2 to generate an SQL query based on user input"""
-    # Preprocess the query to handle common abbreviations
+def preprocess_query(user_query: str) -> str:
+    """Normalize a user query: lowercase and expand common abbreviations"""
     preprocessed_query = user_query.lower().strip()
-    
+
     # Replace "KL" with "Kuala Lumpur" in the query for better matching
-    import re
-    preprocessed_query = re.sub(r'\bkl\b', 'kuala lumpur', preprocessed_query)
-    
-    # Special case handling for specific 24-hour query
-    if ("which outlets" in preprocessed_query and 
-        "operate 24 hours" in preprocessed_query and 
-        ("kl" in preprocessed_query or "kuala lumpur" in preprocessed_query)):
-        return """SELECT * FROM stores 
-               WHERE operating_hours LIKE '%24%' 
-               AND (address LIKE '%kuala lumpur%' OR address LIKE '%kl%')
-               AND name NOT LIKE '%klia%'"""
-    
-    # Special case handling for birthday party query
-    if ("which outlet" in preprocessed_query and 
-        "allows birthday parties" in preprocessed_query):
-        return """SELECT * FROM stores 
-               WHERE has_birthday_party = 1
-               AND (address LIKE '%kuala lumpur%' OR address LIKE '%kl%')
-               AND name NOT LIKE '%klia%'"""
-    
-    # For debugging
-    if preprocessed_query != user_query.lower():
-        print(f"Preprocessed query: '{preprocessed_query}' (original: '{user_query}')")
+    return re.sub(r'\bkl\b', 'kuala lumpur', preprocessed_query)
 
-    prompt = f"""You are an expert SQL assistant. Generate an SQL query based on the user's question.
+def build_sql_prompt(user_query: str) -> str:
+    """Few-shot prompt asking the LLM to translate a question into SQLite"""
+    return f"""You are an expert SQL assistant. Generate an SQL query based on the user's question.
 
 Database Table: `stores`
 Columns: 
@@ -80,6 +70,11 @@ Columns:
 - telephone, email (contact info)
 - has_birthday_party, has_breakfast, has_cashless, has_dessert_center (features)
 - has_digital_kiosk, has_mccafe, has_wifi, has_mcdelivery (more features)
+- is_24h (1 = open 24 hours)
+- weekly_hours (opening hours; test with is_open_at(weekly_hours, 'now' | 'HH:MM' | 'sun 21:00') = 1, Malaysia time)
+
+Full-text table: `stores_fts` (name, address, area), rowid = stores.id
+- area holds the postcode, city, state and short names (e.g. "kl") of each outlet
 
 Rules:
 1. Only generate `SELECT` queries.
@@ -87,45 +82,86 @@ Rules:
 3. Ensure the SQL query is compatible with SQLite.
 4. Do NOT use `DROP`, `DELETE`, `INSERT`, or `UPDATE`.
 5. Return ONLY the SQL query. No explanations.
-6. For location queries, be inclusive with LIKE operators.
-7. For feature queries, use the has_* columns (1 = yes, 0 = no).
-8. When searching for "kuala lumpur", also include "kl" in the search.
+6. For location queries, use `id IN (SELECT rowid FROM stores_fts WHERE stores_fts MATCH '...')`, never LIKE on address.
+7. For feature queries, use the has_* columns and is_24h (1 = yes, 0 = no).
+   For "open now" / "open at <time>" questions, use is_open_at(weekly_hours, ...) = 1, never operating_hours.
+8. Quote multi-word places ('"bukit bintang"'); postcodes can be matched directly ('53300').
 
 Examples:
 User: "Which outlets in KL operate 24 hours?"
-SQL: SELECT * FROM stores WHERE operating_hours LIKE '%24%' AND (address LIKE '%kuala lumpur%' OR address LIKE '%kl%');
+SQL: SELECT * FROM stores WHERE is_24h = 1 AND id IN (SELECT rowid FROM stores_fts WHERE stores_fts MATCH '"kuala lumpur"');
 
 User: "List outlets that allow birthday parties"
 SQL: SELECT * FROM stores WHERE has_birthday_party = 1;
 
 User: "Find 24-hour McDonald's with WiFi in KL"
-SQL: SELECT * FROM stores WHERE operating_hours LIKE '%24%' AND has_wifi = 1 AND (address LIKE '%kuala lumpur%' OR address LIKE '%kl%');
+SQL: SELECT * FROM stores WHERE is_24h = 1 AND has_wifi = 1 AND id IN (SELECT rowid FROM stores_fts WHERE stores_fts MATCH '"kuala lumpur"');
 
 User: "Show McDonald's with McCafe and breakfast"
 SQL: SELECT * FROM stores WHERE has_mccafe = 1 AND has_breakfast = 1;
 
+User: "Anything in Bangsar still open at 2am?"
+SQL: SELECT * FROM stores WHERE is_open_at(weekly_hours, '02:00') = 1 AND id IN (SELECT rowid FROM stores_fts WHERE stores_fts MATCH 'bangsar');
+
 User Query: "{user_query}"
 SQL:"""
 
-    try:
-        response = together.Complete.create(
-            prompt=prompt,
-            model="meta-llama/Llama-2-70b-hf",
-            max_tokens=150,
-            temperature=0.2,
-            stop=["\n"]
-        )
+# Cached SQL is only valid for the prompt and model that generated it
+SQL_CACHE_VERSION = hashlib.sha256(f"{MODEL_NAME}\n{build_sql_prompt('')}".encode()).hexdigest()[:12]
+
+def sql_cache_key(preprocessed_query: str) -> str:
+    """Persistent SQL cache key: the canonical question under the current prompt/model version"""
+    return f"{SQL_CACHE_VERSION}:{canonicalize_query(preprocessed_query)}"
+
+def parse_llm_sql(response: Dict) -> str:
+    """Extract the SQL from a completion response (or an "Error: ..." string)"""
+    if "choices" in response and response["choices"]:
+        sql_query = response["choices"][0]["text"].strip()
+        if sql_query:
+            return sql_query
+        return "Error: Empty response from LLM"
+    return "Error: Invalid LLM response format"
+
+async def agenerate_sql_query(user_query: str) -> str:
+    """LLM translation of a question into SQL: bounded, deadline-limited call off the event loop.
 
-        if "choices" in response and response["choices"]:
-            sql_query = response["choices"][0]["text"].strip()
-            if sql_query:
-                return sql_query
-            return "Error: Empty response from LLM"
-        return "Error: Invalid LLM response format"
+    Raises LLMOverloaded when the LLM queue is full so the caller can shed load.
+    """
+    preprocessed_query = preprocess_query(user_query)
+    cache_key = sql_cache_key(preprocessed_query)
+    cached_sql = await run_in_threadpool(sql_cache.get, cache_key)
+    if cached_sql:
+        return cached_sql
+    if not TOGETHER_API_KEY:
+        return NO_API_KEY_ERROR
 
+    try:
+        response = await llm_client.complete({
+            "model": MODEL_NAME,
+            "prompt": build_sql_prompt(user_query),
+            "max_tokens": 150,
+            "temperature": 0.2,
+            "stop": ["\n"]
+        })
+    except LLMOverloaded:
+        raise
+    except LLMTimeout:
+        return "Error: LLM timed out"
     except Exception as e:
         return f"Error: {str(e)}"
 
+    sql_query = parse_llm_sql(response)
+    if sql_query.lower().startswith("select"):
+        await run_in_threadpool(sql_cache.put, cache_key, sql_query)
+    return sql_query
+
+async def atranslate_query(user_query: str) -> Tuple[str, Tuple]:
+    """Turn a user query into (sql, params): rule-based parser first, LLM as fallback"""
+    compiled = rule_based_sql(preprocess_query(user_query))
+    if compiled:
+        return compiled
+    return await agenerate_sql_query(user_query), ()
+
 def format_store_response(store_data: Dict) -> Dict:
     """Format store data for the API response"""
     return {
@@ -136,6 +172,7 @@ def format_store_response(store_data: Dict) -> Dict:
             "longitude": store_data.get("lng")
         },
         "operating_hours": store_data.get("operating_hours", "N/A"),
+        "open_now": is_open(decode_hours(store_data.get("weekly_hours")), week_minute()),
         "waze_link": store_data.get("waze_link", "N/A"),
         "contact": {
             "telephone": store_data.get("telephone", "N/A"),
@@ -156,40 +193,35 @@ def format_store_response(store_data: Dict) -> Dict:
 
 def initialize_database():
     """Create the stores table if it doesn't exist"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS stores (
-        id INTEGER PRIMARY KEY,
-        name TEXT NOT NULL,
-        address TEXT NOT NULL,
-        lat REAL,
-        lng REAL,
-        operating_hours TEXT,
-        waze_link TEXT,
-        telephone TEXT,
-        email TEXT,
-        has_birthday_party INTEGER DEFAULT 0,
-        has_breakfast INTEGER DEFAULT 0,
-        has_cashless INTEGER DEFAULT 0,
-        has_dessert_center INTEGER DEFAULT 0,
-        has_digital_kiosk INTEGER DEFAULT 0,
-        has_mccafe INTEGER DEFAULT 0,
-        has_wifi INTEGER DEFAULT 0,
-        has_mcdelivery INTEGER DEFAULT 0
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with writer() as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS stores (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            address TEXT NOT NULL,
+            lat REAL,
+            lng REAL,
+            operating_hours TEXT,
+            waze_link TEXT,
+            telephone TEXT,
+            email TEXT,
+            has_birthday_party INTEGER DEFAULT 0,
+            has_breakfast INTEGER DEFAULT 0,
+            has_cashless INTEGER DEFAULT 0,
+            has_dessert_center INTEGER DEFAULT 0,
+            has_digital_kiosk INTEGER DEFAULT 0,
+            has_mccafe INTEGER DEFAULT 0,
+            has_wifi INTEGER DEFAULT 0,
+            has_mcdelivery INTEGER DEFAULT 0
+        )
+        ''')
     print("Database initialized with 'stores' table")
 
-@router.get("/")
-def chatbot_query(query: str = Query(..., min_length=3, example="Find McDonald's with McCafe")):
-    """Chatbot that retrieves McDonald's store details based on user queries"""
-    query_lower = query.lower().strip()
-    
+ERROR_RESPONSE = "I'm sorry, I encountered an issue processing your request. Please try again with a different question."
+NO_MATCH_RESPONSE = "I couldn't find any matching McDonald's locations. Try a different location or ask about specific features."
+
+def conversational_reply(query_lower: str) -> Optional[str]:
+    """Canned reply for greetings/thanks/farewells, None for store searches"""
     # First check if this is a specific location/feature query
     is_location_query = any(term in query_lower for term in [
         "outlets", "stores", "locations", "find", "list", "which",
@@ -197,69 +229,259 @@ def chatbot_query(query: str = Query(..., min_length=3, example="Find McDonald's
     ])
     
     # Only handle conversational phrases if this isn't a location/feature query
-    if not is_location_query:
-        # Handle conversational phrases
-        gratitude_phrases = ["thank you", "thanks", "appreciate it", "cheers"]
-        if any(phrase in query_lower for phrase in gratitude_phrases):
-            return {
-                "response": "You're welcome! Happy to help with McDonald's locations and features.",
-                "matches": 0,
-                "data": []
-            }
-        
-        greeting_phrases = ["hi", "hello", "hey", "greetings"]
-        if any(phrase in query_lower for phrase in greeting_phrases):
-            return {
-                "response": "Hello! I can help you find McDonald's locations and their features (like McCafe, WiFi, etc.). What are you looking for?",
-                "matches": 0,
-                "data": []
-            }
-        
-        farewell_phrases = ["bye", "goodbye", "see you", "farewell"]
-        if any(phrase in query_lower for phrase in farewell_phrases):
+    if is_location_query:
+        return None
+
+    gratitude_phrases = ["thank you", "thanks", "appreciate it", "cheers"]
+    if any(phrase in query_lower for phrase in gratitude_phrases):
+        return "You're welcome! Happy to help with McDonald's locations and features."
+    
+    greeting_phrases = ["hi", "hello", "hey", "greetings"]
+    if any(phrase in query_lower for phrase in greeting_phrases):
+        return "Hello! I can help you find McDonald's locations and their features (like McCafe, WiFi, etc.). What are you looking for?"
+    
+    farewell_phrases = ["bye", "goodbye", "see you", "farewell"]
+    if any(phrase in query_lower for phrase in farewell_phrases):
+        return "Goodbye! Come back if you need more help finding McDonald's locations or their features."
+    return None
+
+def summary_text(query_lower: str, matches: int) -> str:
+    """Response text for a query with ``matches`` results"""
+    if "24 hour" in query_lower or "24-hour" in query_lower:
+        if "kl" in query_lower or "kuala lumpur" in query_lower:
+            return f"Found {matches} 24-hour McDonald's locations in Kuala Lumpur:"
+        return f"Found {matches} 24-hour McDonald's locations:"
+    if "birthday party" in query_lower or "birthday parties" in query_lower:
+        return f"Found {matches} McDonald's locations that allow birthday parties:"
+    return f"Found {matches} McDonald's locations matching your query:"
+
+async def translate_or_shed(query: str) -> Tuple[str, Tuple]:
+    """atranslate_query, turning a full LLM queue into a 503"""
+    try:
+        return await atranslate_query(query)
+    except LLMOverloaded:
+        raise HTTPException(
+            status_code=503,
+            detail="The chatbot is busy right now. Please try again shortly.",
+            headers={"Retry-After": "2"}
+        )
+
+SEMANTIC_TOP_K = 10
+
+def semantic_response(query: str, query_lower: str) -> Dict:
+    """Top-k stores from the local vector index, without any LLM call"""
+    with span("semantic_search"):
+        hits = semantic_search(query, SEMANTIC_TOP_K)
+    if not hits:
+        return {"response": NO_MATCH_RESPONSE, "matches": 0, "data": []}
+    return {
+        "query": query,
+        "response": summary_text(query_lower, len(hits)),
+        "retrieval": "semantic",
+        "sql_query": None,
+        "matches": len(hits),
+        "scores": [round(score, 4) for score, _ in hits],
+        "data": [format_store_response(store) for _, store in hits]
+    }
+
+# Stop proxies from buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, data) -> str:
+    """One Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.get("/cache")
+def chatbot_cache_stats():
+    """Hit/miss counters for the SQL translation cache, LLM client, SQL sandbox and DB pool"""
+    return {**sql_cache.stats(), "llm": llm_client.stats(), "sandbox": sql_sandbox.stats(), "db": pool_stats()}
+
+@router.get("/")
+async def chatbot_query(
+    query: str = Query(..., min_length=3, example="Find McDonald's with McCafe"),
+    mode: str = Query("auto", pattern="^(auto|sql|semantic)$",
+                      description="sql: translate to SQL only; semantic: local vector search only; "
+                                  "auto: SQL, falling back to semantic search only when no valid SQL comes out")
+):
+    """Chatbot that retrieves McDonald's store details based on user queries"""
+    query_lower = query.lower().strip()
+
+    with span("preprocess"):
+        reply = conversational_reply(query_lower)
+    if reply:
+        return {"response": reply, "matches": 0, "data": []}
+
+    if mode == "semantic":
+        return await run_in_threadpool(semantic_response, query, query_lower)
+
+    # Queries the parser understands are answered from the in-memory store table
+    with span("parse"):
+        intent = confident_intent(preprocess_query(query))
+    if intent:
+        sql_query, sql_params = compile_intent(intent)
+        with span("table_match"):
+            results = await run_in_threadpool(match_intent, intent.clauses, intent.locations, intent.names, MAX_ROWS,
+                                              intent.open_at, intent.excluded_locations)
+        retrieval = "table"
+    else:
+        # Generate SQL query
+        try:
+            with span("translate"):
+                sql_query, sql_params = await translate_or_shed(query)
+        except HTTPException:
+            if mode == "sql":
+                raise
+            # LLM overloaded: answer locally instead of shedding
+            return await run_in_threadpool(semantic_response, query, query_lower)
+
+        if sql_query.startswith("Error:"):
+            if mode == "auto":
+                return await run_in_threadpool(semantic_response, query, query_lower)
             return {
-                "response": "Goodbye! Come back if you need more help finding McDonald's locations or their features.",
+                "response": ERROR_RESPONSE,
                 "matches": 0,
                 "data": []
             }
 
-    # Generate SQL query
-    sql_query = generate_sql_query(query)
-    
-    if sql_query.startswith("Error:"):
-        return {
-            "response": "I'm sorry, I encountered an issue processing your request. Please try again with a different question.",
-            "matches": 0,
-            "data": []
-        }
-
-    results = execute_sql_query(sql_query)
+        # SQLite is blocking; keep it off the event loop
+        with span("execute"):
+            results = await run_in_threadpool(execute_sql_query, sql_query, sql_params)
+        retrieval = "sql"
     
+    if results and "error" in results[0] and mode == "auto":
+        # The generated SQL didn't run; a valid query that finds nothing is a real "no match"
+        return await run_in_threadpool(semantic_response, query, query_lower)
     if not results or "error" in results[0]:
         return {
-            "response": "I couldn't find any matching McDonald's locations. Try a different location or ask about specific features.",
+            "response": NO_MATCH_RESPONSE,
             "matches": 0,
             "data": []
         }
     
+    return results_response(query, query_lower, sql_query, sql_params, results, retrieval)
+
+def results_response(query: str, query_lower: str, sql_query: str, sql_params: Tuple,
+                     results: List[Dict], retrieval: str) -> Dict:
+    """Response body for a query that matched ``results``"""
     # Format the results with all features
-    formatted_results = [format_store_response(store) for store in results]
+    with span("format"):
+        formatted_results = [format_store_response(store) for store in results]
     
-    # Generate appropriate response text
-    if "24 hour" in query_lower or "24-hour" in query_lower:
-        if "kl" in query_lower or "kuala lumpur" in query_lower:
-            response_text = f"Found {len(results)} 24-hour McDonald's locations in Kuala Lumpur:"
-        else:
-            response_text = f"Found {len(results)} 24-hour McDonald's locations:"
-    elif "birthday party" in query_lower or "birthday parties" in query_lower:
-        response_text = f"Found {len(results)} McDonald's locations that allow birthday parties:"
-    else:
-        response_text = f"Found {len(results)} McDonald's locations matching your query:"
+    response_text = summary_text(query_lower, len(results))
 
     return {
         "query": query,
         "response": response_text,
+        "retrieval": retrieval,
         "sql_query": sql_query,
+        "sql_params": list(sql_params),
         "matches": len(results),
         "data": formatted_results
-    }
\ No newline at end of file
+    }
+
+MAX_BATCH_QUERIES = 100
+# Unique questions translated at once; the LLM client still applies its own limit
+BATCH_CONCURRENCY = LLM_MAX_CONCURRENCY
+BUSY_RESPONSE = "The chatbot is busy right now. Please try again shortly."
+
+@router.post("/batch")
+async def chatbot_batch(queries: List[str] = Body(..., embed=True, min_length=1, max_length=MAX_BATCH_QUERIES)):
+    """Answer many questions at once; results come back in input order.
+
+    Questions that are the same after preprocessing are translated and run
+    once, translations run in parallel, and every query reads the same
+    database snapshot.
+    """
+    results: List[Optional[Dict]] = [None] * len(queries)
+    groups: Dict[str, List[int]] = {}
+    with span("preprocess"):
+        for i, query in enumerate(queries):
+            reply = conversational_reply(query.lower().strip())
+            if reply:
+                results[i] = {"query": query, "response": reply, "matches": 0, "data": []}
+            else:
+                groups.setdefault(canonicalize_query(preprocess_query(query)), []).append(i)
+
+    # Translate one representative question per group, with bounded fan-out
+    fan_out = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def translate(index: int) -> Optional[Tuple[str, Tuple]]:
+        async with fan_out:
+            try:
+                return await atranslate_query(queries[index])
+            except LLMOverloaded:
+                return None
+
+    with span("translate"):
+        translations = await asyncio.gather(*(translate(indices[0]) for indices in groups.values()))
+
+    # Identical SQL from different wordings runs once, all in one read transaction
+    statements = list(dict.fromkeys(
+        translation for translation in translations if translation and not translation[0].startswith("Error:")
+    ))
+    with span("execute"):
+        rows = await run_in_threadpool(sql_sandbox.run_many, statements) if statements else []
+    rows_by_statement = dict(zip(statements, rows))
+
+    for indices, translation in zip(groups.values(), translations):
+        for i in indices:
+            query = queries[i]
+            if translation is None:
+                results[i] = {"query": query, "response": BUSY_RESPONSE, "matches": 0, "data": []}
+                continue
+            found = rows_by_statement.get(translation)
+            if found is None:
+                results[i] = {"query": query, "response": ERROR_RESPONSE, "matches": 0, "data": []}
+            elif isinstance(found, Exception) or not found:
+                results[i] = {"query": query, "response": NO_MATCH_RESPONSE, "matches": 0, "data": []}
+            else:
+                results[i] = results_response(query, query.lower().strip(), translation[0], translation[1],
+                                              found, "sql")
+
+    return {"results": results, "unique_queries": len(groups), "statements": len(statements)}
+
+@router.get("/stream")
+async def chatbot_stream(query: str = Query(..., min_length=3, example="Find McDonald's with McCafe")):
+    """Streaming chatbot over Server-Sent Events.
+
+    Emits ``sql`` as soon as the query is translated, one ``store`` event per
+    result row as it is read, then ``summary``, or ``error`` if the query fails
+    (after any rows already sent).
+    """
+    query_lower = query.lower().strip()
+
+    reply = conversational_reply(query_lower)
+    if reply:
+        async def conversation() -> AsyncIterator[str]:
+            yield sse_event("summary", {"response": reply, "matches": 0})
+        return StreamingResponse(conversation(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    # Translate before responding so overload still surfaces as a 503
+    sql_query, sql_params = await translate_or_shed(query)
+
+    async def events() -> AsyncIterator[str]:
+        if sql_query.startswith("Error:"):
+            yield sse_event("error", {"response": ERROR_RESPONSE})
+            return
+        yield sse_event("sql", {"query": query, "sql_query": sql_query, "sql_params": list(sql_params)})
+
+        matches = 0
+        try:
+            async for rows in iterate_in_threadpool(iter_sql_rows(sql_query, sql_params)):
+                for store in rows:
+                    matches += 1
+                    yield sse_event("store", format_store_response(store))
+        except (sqlite3.Error, QueryRejected, QueryAborted):
+            # Rows already sent are an incomplete answer: no summary, just the error
+            if not matches:
+                yield sse_event("error", {"response": NO_MATCH_RESPONSE})
+            else:
+                yield sse_event("error", {"response": ERROR_RESPONSE, "matches": matches})
+            return
+
+        if not matches:
+            yield sse_event("summary", {"response": NO_MATCH_RESPONSE, "matches": 0})
+        else:
+            yield sse_event("summary", {"response": summary_text(query_lower, matches), "matches": matches})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from opening_hours import is_open_at_sql
+
+# Database setup
+DB_NAME = "mcdonalds_stores.db"
+
+MMAP_SIZE = 256 * 1024 * 1024  # Map the (small) database instead of copying pages
+CACHE_SIZE_KB = 16 * 1024  # Per-connection page cache
+BUSY_TIMEOUT = 30  # Seconds the writer waits for a lock
+
+
+def configure(conn: sqlite3.Connection, read_only: bool) -> sqlite3.Connection:
+    """Apply the shared pragmas to a new connection"""
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # is_open_at(weekly_hours, 'now' | '02:00' | 'sun 21:00' | minute of week)
+    conn.create_function("is_open_at", 2, is_open_at_sql)
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        # WAL lets readers keep going while the scraper writes
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def connect_reader(db_path: str = DB_NAME, check_same_thread: bool = True, **kwargs) -> sqlite3.Connection:
+    """A new read-only connection with the shared pragmas (for streaming/one-off use)"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=check_same_thread, **kwargs)
+    return configure(conn, read_only=True)
+
+
+class ConnectionPool:
+    """Per-thread read-only connections plus one shared writer for a database file"""
+
+    def __init__(self, db_path: str = DB_NAME):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._readers: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._wal_checked = False
+        self.counters = {"reader_connects": 0, "reader_checkouts": 0, "writer_checkouts": 0,
+                         "writer_wait_ms": 0.0}
+
+    def _ensure_wal(self):
+        # journal_mode is stored in the file; switching needs write access once
+        if self._wal_checked:
+            return
+        self._wal_checked = True
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Could not enable WAL on {self.db_path}: {e}")
+
+    def reader(self) -> sqlite3.Connection:
+        """This thread's read-only connection (rows come back as sqlite3.Row)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._ensure_wal()
+            # Only this thread uses it, but the pool may close it once the thread is gone
+            conn = connect_reader(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._lock:
+                exited = [thread for thread in self._readers if not thread.is_alive()]
+                stale = [self._readers.pop(thread) for thread in exited]
+                self._readers[threading.current_thread()] = conn
+                self.counters["reader_connects"] += 1
+            for old in stale:
+                old.close()
+        with self._lock:
+            self.counters["reader_checkouts"] += 1
+        return conn
+
+    def release(self):
+        """Close this thread's reader, if any (for short-lived threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            self._readers.pop(threading.current_thread(), None)
+        conn.close()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """The single writer connection, held for one transaction.
+
+        Commits on success and rolls back on error; concurrent writers in this
+        process queue on a lock instead of fighting over SQLite's.
+        """
+        started = time.perf_counter()
+        with self._writer_lock:
+            waited = (time.perf_counter() - started) * 1000
+            if self._writer is None:
+                conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+                self._writer = configure(conn, read_only=False)
+                self._wal_checked = True
+            with self._lock:
+                self.counters["writer_checkouts"] += 1
+                self.counters["writer_wait_ms"] += waited
+            with self._writer:
+                yield self._writer
+
+    def close_all(self):
+        """Close every connection (e.g. after the database file was replaced)"""
+        with self._lock:
+            readers, self._readers = self._readers, {}
+        for conn in readers.values():
+            conn.close()
+        self._local = threading.local()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.counters, readers_open=len(self._readers), writer_open=self._writer is not None)
+        stats["writer_wait_ms"] = round(stats["writer_wait_ms"], 3)
+        return stats
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = DB_NAME) -> ConnectionPool:
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(db_path, ConnectionPool(db_path))
+    return pool
+
+
+def reader(db_path: str = DB_NAME) -> sqlite3.Connection:
+    """Shortcut for get_pool(db_path).reader()"""
+    return get_pool(db_path).reader()
+
+
+def release_reader(db_path: str = DB_NAME):
+    """Shortcut for get_pool(db_path).release(); no-op if the pool was never used"""
+    pool = _pools.get(db_path)
+    if pool is not None:
+        pool.release()
+
+
+def writer(db_path: str = DB_NAME):
+    """Shortcut for get_pool(db_path).writer()"""
+    return get_pool(db_path).writer()
+
+
+def pool_stats() -> Dict[str, Dict]:
+    return {db_path: pool.stats() for db_path, pool in list(_pools.items())}
@@ -0,0 +1,168 @@
+import argparse
+import csv
+import io
+import json
+from typing import Iterator, List, Optional, Tuple
+
+from db import connect_reader
+from store_cache import DB_NAME, FEATURE_COLUMNS, STORE_COLUMNS, parse_coordinate
+
+CHUNK_SIZE = 1000
+
+# CSV headers, in STORE_COLUMNS order
+CSV_HEADERS = [
+    "ID", "Name", "Address", "Latitude", "Longitude", "Operating Hours", "Waze Link",
+    "Telephone", "Email", "Birthday Party", "Breakfast", "Cashless Facility",
+    "Dessert Center", "Digital Kiosk", "McCafe", "WiFi", "McDelivery", "Weekly Hours"
+]
+
+STREAM_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+
+# ========== STREAMING EXPORT ==========
+def iter_row_chunks(db_path: str = DB_NAME, chunk_size: int = CHUNK_SIZE,
+                    table: str = "stores") -> Iterator[List[Tuple]]:
+    """Walk the stores table (or a view of it) in id order, ``chunk_size`` rows at a time"""
+    # Own connection: a streaming response may resume this generator on any thread
+    conn = connect_reader(db_path, check_same_thread=False)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+            table = "stores"  # Database predates the view
+        cursor = conn.execute(f"SELECT {', '.join(STORE_COLUMNS)} FROM {table} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def iter_csv(db_path: str = DB_NAME, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """CSV text, one chunk of rows per yielded string"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADERS)
+    # Text coordinates ("N/A" when missing), as the CSV has always had them
+    for rows in iter_row_chunks(db_path, chunk_size, table="stores_legacy"):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # Header only: empty table
+        yield buffer.getvalue()
+
+
+def iter_ndjson(db_path: str = DB_NAME, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """One JSON object per line, one chunk of rows per yielded string"""
+    for rows in iter_row_chunks(db_path, chunk_size):
+        yield "".join(
+            json.dumps(dict(zip(STORE_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+        )
+
+
+STREAMERS = {"csv": iter_csv, "ndjson": iter_ndjson}
+
+
+def write_export(path: str, fmt: str = "csv", db_path: str = DB_NAME, chunk_size: int = CHUNK_SIZE) -> int:
+    """Stream the stores table to ``path`` in csv/ndjson; returns bytes written"""
+    written = 0
+    with open(path, mode="w", newline="", encoding="utf-8") as file:
+        for chunk in STREAMERS[fmt](db_path, chunk_size):
+            written += file.write(chunk)
+    return written
+
+
+# ========== COLUMNAR SNAPSHOT ==========
+def _arrow_schema(pa):
+    return pa.schema(
+        [("id", pa.int64()), ("name", pa.string()), ("address", pa.string()),
+         ("lat", pa.float64()), ("lng", pa.float64()),
+         ("operating_hours", pa.dictionary(pa.int32(), pa.string())),
+         ("waze_link", pa.string()), ("telephone", pa.string()), ("email", pa.string())]
+        + [(column, pa.bool_()) for column in FEATURE_COLUMNS.values()]
+        + [("weekly_hours", pa.string())]
+    )
+
+
+def write_columnar(path: str, fmt: str = "parquet", db_path: str = DB_NAME, chunk_size: int = CHUNK_SIZE) -> int:
+    """Write a typed columnar snapshot (Parquet, or Arrow IPC for memory-mapping).
+
+    Coordinates become float64 (null when missing) and features booleans.
+    Requires the optional ``pyarrow`` package. Returns the number of rows.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Columnar export needs pyarrow: pip install pyarrow")
+
+    schema = _arrow_schema(pa)
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+        write = writer.write_batch
+    elif fmt == "arrow":
+        sink = pa.OSFile(path, "wb")
+        writer = pa.ipc.new_file(sink, schema)
+        write = writer.write_batch
+    else:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+
+    # One read transaction, so the operating_hours dictionary covers every chunk: the IPC file
+    # format rejects a batch whose dictionary differs from the first
+    conn = connect_reader(db_path)
+    total = 0
+    try:
+        conn.execute("BEGIN")
+        hours = [value for (value,) in conn.execute(
+            "SELECT DISTINCT operating_hours FROM stores WHERE operating_hours IS NOT NULL ORDER BY 1"
+        )]
+        dictionary = pa.array(hours, type=pa.string())
+        codes = {value: code for code, value in enumerate(hours)}
+        cursor = conn.execute(f"SELECT {', '.join(STORE_COLUMNS)} FROM stores ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            columns[3] = [parse_coordinate(value) for value in columns[3]]
+            columns[4] = [parse_coordinate(value) for value in columns[4]]
+            columns[5] = pa.DictionaryArray.from_arrays(
+                pa.array([codes.get(value) for value in columns[5]], type=pa.int32()), dictionary
+            )
+            for i in range(9, 9 + len(FEATURE_COLUMNS)):
+                columns[i] = [bool(value) for value in columns[i]]
+            write(pa.record_batch(
+                [column if isinstance(column, pa.Array) else pa.array(column, type=field.type)
+                 for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            total += len(rows)
+    finally:
+        conn.close()
+        writer.close()
+        if fmt == "arrow":
+            sink.close()
+    return total
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Export the stores table with bounded memory")
+    parser.add_argument("--format", choices=list(STREAM_FORMATS) + list(COLUMNAR_FORMATS), default="csv")
+    parser.add_argument("--output", help="Output file (default: mcdonalds_stores.<format>)")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    output = args.output or f"mcdonalds_stores.{args.format}"
+    if args.format in COLUMNAR_FORMATS:
+        rows = write_columnar(output, args.format, args.db, args.chunk_size)
+        print(f"Exported {rows} stores to {output}")
+    else:
+        size = write_export(output, args.format, args.db, args.chunk_size)
+        print(f"Exported {size} bytes to {output}")
+
+
+if __name__ == "__main__":
+    main()
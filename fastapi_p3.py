@@ -1,16 +1,75 @@
-from fastapi import FastAPI
+import threading
+import time
+from contextlib import asynccontextmanager
+
+IMPORT_STARTED = time.perf_counter()  # Cold-start clock for /readyz
+
+from fastapi import FastAPI, Path, Query, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import sqlite3
-import requests
-import os
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
-from chatbot_p5 import router as chatbot_router  # Import chatbot
+from chatbot_p5 import llm_client, router as chatbot_router  # Import chatbot
+from spatial_index import store_index
+from vector_index import store_vectors, vector_stats
+from store_table import store_table
+from store_tiles import MAX_ZOOM, cluster_stats, get_tile, store_clusters
+from overlap_graph import DEFAULT_RADIUS_M, RADIUS_STEP_M, get_overlaps
+from store_cache import FEATURE_COLUMNS, FEATURE_BITS, DerivedCache, feature_mask
+from store_snapshot import Snapshot, snapshot_response
+from opening_hours import TIMEZONE_NAME, decode_hours, resolve_time
+from geocode_cache import geocode_stats, lookup_cached, schedule_fill_missing
+from export_stores import STREAM_FORMATS, STREAMERS
+from migrations import migrate
+from metrics import MetricsMiddleware, registry, span
+from sql_cache import sql_cache
+from sql_sandbox import sql_sandbox
+from db import pool_stats
 
 # Load environment variables
 load_dotenv()
 
+# ========== STARTUP ==========
+startup = {"import_s": None, "migrate_s": None, "warm_s": {}, "ready_s": None, "ready": False, "error": None}
+
+def warm_caches():
+    """Build the store snapshot and indexes so the first requests don't pay for them"""
+    warmers = [
+        ("stores_snapshot", lambda: stores_snapshot.get()),
+        ("store_table", store_table.get),
+        ("store_index", store_index.get),
+        ("store_clusters", store_clusters.get),
+        ("overlaps", lambda: get_overlaps(DEFAULT_RADIUS_M)),
+        ("store_vectors", store_vectors.get),
+    ]
+    try:
+        for name, warm in warmers:
+            started = time.perf_counter()
+            warm()
+            startup["warm_s"][name] = round(time.perf_counter() - started, 3)
+        startup["ready_s"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+        startup["ready"] = True
+        print(f"Caches warm {startup['ready_s']}s after import")
+    except Exception as e:
+        startup["error"] = str(e)
+        print(f"Cache warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup["import_s"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    # Bring the schema up to date before serving (no-op when already current)
+    started = time.perf_counter()
+    try:
+        migrate()
+    except Exception as e:
+        print(f"Schema migration failed: {e}")
+    startup["migrate_s"] = round(time.perf_counter() - started, 3)
+    # Serve (and answer /healthz) right away; /readyz turns 200 once this finishes
+    threading.Thread(target=warm_caches, name="cache-warmup", daemon=True).start()
+    yield
+
 # Initialize FastAPI App
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for frontend access
 app.add_middleware(
@@ -21,94 +80,200 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Google API Key from environment variable
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-# Function to get coordinates from Google Maps API
-def get_coordinates(address):
-    base_url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {"address": address, "key": GOOGLE_API_KEY}
-    response = requests.get(base_url, params=params)
-    data = response.json()
-    
-    if data["status"] == "OK":
-        location = data["results"][0]["geometry"]["location"]
-        return location["lat"], location["lng"]
-    return None, None
-
-# Database connection dependency
-def get_db_connection():
-    conn = sqlite3.connect("mcdonalds_stores.db")
-    conn.row_factory = sqlite3.Row  # Allows accessing columns by name
-    return conn
-
-# Function to fetch stores from the database
-def get_stores():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT 
-            name, 
-            address, 
-            lat, 
-            lng, 
-            operating_hours, 
-            waze_link,
-            telephone,
-            email,
-            has_birthday_party,
-            has_breakfast,
-            has_cashless,
-            has_dessert_center,
-            has_digital_kiosk,
-            has_mccafe,
-            has_wifi,
-            has_mcdelivery
-        FROM stores
-    ''')
-    stores = cursor.fetchall()
-    conn.close()
-    
-    store_list = []
-    for store in stores:
-        store_dict = {
-            "name": store["name"],
-            "address": store["address"],
-            "latitude": store["lat"],
-            "longitude": store["lng"],
-            "operating_hours": store["operating_hours"],
-            "waze_link": store["waze_link"],
-            "contact": {
-                "telephone": store["telephone"],
-                "email": store["email"]
-            },
-            "features": {
-                "birthday_party": bool(store["has_birthday_party"]),
-                "breakfast": bool(store["has_breakfast"]),
-                "cashless": bool(store["has_cashless"]),
-                "dessert_center": bool(store["has_dessert_center"]),
-                "digital_kiosk": bool(store["has_digital_kiosk"]),
-                "mccafe": bool(store["has_mccafe"]),
-                "wifi": bool(store["has_wifi"]),
-                "mcdelivery": bool(store["has_mcdelivery"])
-            }
+# Per-route latency histograms, plus the sampling profiler when PROFILE_SLOW_MS is set
+app.add_middleware(MetricsMiddleware)
+
+# Components keep their own counters; /metrics reads them at scrape time
+registry.register_collector("llm", lambda: [({}, llm_client.stats())],
+                            gauges=["in_flight", "waiting", "hedge_delay"])
+registry.register_collector("sql_cache", lambda: [({}, sql_cache.stats())], gauges=["memory_entries", "hit_rate"])
+registry.register_collector("sql_sandbox", lambda: [({}, sql_sandbox.stats())])
+registry.register_collector("geocode", lambda: [({}, geocode_stats())])
+registry.register_collector("map_clusters", lambda: [({}, cluster_stats())])
+registry.register_collector("vector_index", lambda: [({}, vector_stats())])
+registry.register_collector("db_pool", lambda: [({"db": path}, stats) for path, stats in pool_stats().items()],
+                            gauges=["readers_open", "writer_open"])
+
+# Format a cached store row (see store_cache.load_stores) for the API
+def format_store(store: Dict) -> Dict:
+    return {
+        "name": store["name"],
+        "address": store["address"],
+        "latitude": store["lat"],
+        "longitude": store["lng"],
+        "operating_hours": store["operating_hours"],
+        "weekly_hours": decode_hours(store["weekly_hours"]),
+        "waze_link": store["waze_link"],
+        "contact": {
+            "telephone": store["telephone"],
+            "email": store["email"]
+        },
+        "features": {
+            name: bool(store[column]) for name, column in FEATURE_COLUMNS.items()
         }
+    }
+
+# Function to build the store list from the cached rows
+def get_stores(rows: List[Dict]) -> List[Dict]:
+    store_list = [format_store(store) for store in rows]
+
+    # If lat/lng is missing, use cached geocodes only and let a background
+    # task fill the stores table; requests never wait on the geocoder
+    missing = [store for store in store_list if store["latitude"] is None or store["longitude"] is None]
+    if missing:
+        with span("geocode_cache"):
+            cached = lookup_cached(store["address"] for store in missing)
+        for store in missing:
+            store["latitude"], store["longitude"] = cached.get(store["address"], (None, None))
+        # Addresses cached as "no result" aren't worth a backfill until the entry expires
+        if any(store["address"] not in cached for store in missing):
+            schedule_fill_missing()
 
-        # If lat/lng is missing, fetch from Google Maps API
-        if store_dict["latitude"] is None or store_dict["longitude"] is None:
-            lat, lng = get_coordinates(store_dict["address"])
-            store_dict["latitude"] = lat
-            store_dict["longitude"] = lng
-    
-        store_list.append(store_dict)
-    
     return store_list
 
+# Pre-encoded /stores payload, rebuilt only when the database changes
+stores_snapshot = DerivedCache(lambda data, previous: Snapshot({"stores": get_stores(data.rows)}))
+
+# Parse a comma-separated feature list into a bitmask
+def parse_features(features: Optional[str]) -> int:
+    names = [name.strip().lower() for name in (features or "").split(",") if name.strip()]
+    unknown = [name for name in names if name not in FEATURE_BITS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown feature(s): {', '.join(unknown)}. Valid: {', '.join(FEATURE_BITS)}"
+        )
+    return feature_mask(names)
+
+# Top-level fields a /stores client may ask for
+STORE_FIELDS = ["id", "name", "address", "latitude", "longitude", "operating_hours", "weekly_hours", "waze_link",
+                "contact", "features"]
+MAX_PAGE_SIZE = 1000
+
+# Parse "south,west,north,east" (west > east crosses the antimeridian)
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    try:
+        south, west, north, east = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be south,west,north,east")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise HTTPException(status_code=400, detail="bbox is out of range")
+    return south, west, north, east
+
+# Parse "now", "02:00", "0200", "sun 21:00" into a minute of the week
+def parse_open_at(open_at: str) -> int:
+    try:
+        return resolve_time(open_at)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='open_at must be "now", a time ("02:00", "0200", "2am") '
+                                                    'or a day and time ("sun 21:00")')
+
+# Parse a comma-separated field list
+def parse_fields(fields: str) -> List[str]:
+    names = [name.strip().lower() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in STORE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field(s): {', '.join(unknown)}. Valid: {', '.join(STORE_FIELDS)}"
+        )
+    return names
+
 # API Endpoint to Get All Outlets
 @app.get("/stores")
-def read_stores():
-    return {"stores": get_stores()}
+def read_stores(
+    request: Request,
+    bbox: Optional[str] = Query(None, description="Viewport as south,west,north,east", example="3.0,101.5,3.3,101.9"),
+    fields: Optional[str] = Query(None, description="Fields to return", example="id,name,latitude,longitude"),
+    features: Optional[str] = Query(None, example="wifi,mccafe"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[int] = Query(None, ge=0, description="next_cursor from the previous page"),
+    open_at: Optional[str] = Query(None, description=f"Only outlets open then ({TIMEZONE_NAME})", example="now")
+):
+    # The full list is served from the pre-encoded snapshot
+    if bbox is None and fields is None and features is None and limit is None and cursor is None \
+            and open_at is None:
+        with span("snapshot"):
+            return snapshot_response(request, stores_snapshot.get())
+
+    with span("filter"):
+        table = store_table.get()
+        indices = table.select(parse_bbox(bbox) if bbox is not None else None, parse_features(features),
+                               parse_open_at(open_at) if open_at is not None else None)
+        names = parse_fields(fields) if fields is not None else STORE_FIELDS
+        rows, next_cursor = table.page(indices, cursor, limit)
+
+    with span("format"):
+        stores = [
+            {name: store[name] for name in names}
+            for store in (dict(formatted, id=row["id"]) for formatted, row in zip(get_stores(rows), rows))
+        ]
+    return {"stores": stores, "next_cursor": next_cursor}
+
+# API Endpoint to Find Outlets Near a Point
+@app.get("/stores/nearby")
+def read_nearby_stores(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: Optional[float] = Query(None, gt=0, description="Search radius in metres"),
+    k: Optional[int] = Query(None, ge=1, le=1000, description="Return at most the k nearest"),
+    features: Optional[str] = Query(None, example="wifi,mccafe")
+):
+    required = parse_features(features)
+    if radius is None and k is None:
+        k = 10  # Plain "closest outlets to me" lookup
+
+    hits = store_index.get().nearby(lat, lng, radius_m=radius, k=k, required=required)
+    return {
+        "stores": [
+            {**format_store(store), "distance_m": round(distance, 1)}
+            for distance, store in hits
+        ]
+    }
+
+# API Endpoint for Outlets with Overlapping Catchment Areas
+@app.get("/stores/overlaps")
+def read_store_overlaps(
+    radius: float = Query(DEFAULT_RADIUS_M, gt=0, le=100000,
+                         description=f"Catchment radius in metres (rounded to {RADIUS_STEP_M} m)")
+):
+    return get_overlaps(radius)
+
+# API Endpoint for Map Tiles (clusters, or single stores when zoomed in)
+@app.get("/stores/tiles/{z}/{x}/{y}")
+def read_store_tile(
+    z: int = Path(..., ge=0, le=MAX_ZOOM),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0)
+):
+    if x >= 1 << z or y >= 1 << z:
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    return get_tile(z, x, y)
+
+# API Endpoint for Bulk Export (streamed in chunks)
+@app.get("/stores/export")
+def export_stores(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    return StreamingResponse(
+        STREAMERS[format](),
+        media_type=STREAM_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="mcdonalds_stores.{format}"'}
+    )
+
+# Liveness: the process is up and serving
+@app.get("/healthz")
+def read_health():
+    return {"status": "ok"}
+
+# Readiness: caches are warm, so requests won't stall on a rebuild
+@app.get("/readyz")
+def read_ready():
+    status = "ready" if startup["ready"] else "failed" if startup["error"] else "warming"
+    return JSONResponse({"status": status, **startup}, status_code=200 if startup["ready"] else 503)
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # Include chatbot endpoints
 app.include_router(chatbot_router)
@@ -0,0 +1,252 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from db import reader, release_reader, writer
+from store_cache import DB_NAME, parse_coordinate
+
+# Load environment variables
+load_dotenv()
+
+# Google API Key from environment variable
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Point at a local stub (see stub_servers.py) for tests and load runs
+GEOCODE_URL = os.getenv("GEOCODE_URL", "https://maps.googleapis.com/maps/api/geocode/json")
+
+# Kept apart from the stores DB so cache writes don't invalidate store snapshots
+CACHE_DB_NAME = os.getenv("GEOCODE_CACHE_DB", "geocode_cache.db")
+POSITIVE_TTL = 30 * 24 * 3600  # Addresses rarely move
+NEGATIVE_TTL = 24 * 3600  # Retry failed lookups daily, not on every request
+REQUEST_TIMEOUT = 10
+
+# Statuses that mean "this address has no result" rather than "try again later"
+NEGATIVE_STATUSES = {"ZERO_RESULTS", "NOT_FOUND", "INVALID_REQUEST"}
+
+
+# Geocoder and cache activity since startup (exported on /metrics)
+_counters_lock = threading.Lock()
+counters = {"api_calls": 0, "api_failures": 0, "cache_hits": 0, "cache_misses": 0}
+
+
+def _count(counter: str, amount: int = 1):
+    with _counters_lock:
+        counters[counter] += amount
+
+
+def geocode_stats() -> Dict[str, int]:
+    with _counters_lock:
+        return dict(counters)
+
+
+def is_transient(status: str) -> bool:
+    """Whether a failed lookup is worth retrying"""
+    return status != "OK" and status not in NEGATIVE_STATUSES and status != "REQUEST_DENIED"
+
+
+Coordinates = Tuple[Optional[float], Optional[float]]
+
+
+def normalize_address(address: str) -> str:
+    """Cache key for an address: case, spacing and comma layout don't matter"""
+    key = address.lower().strip()
+    key = re.sub(r"\s*,\s*", ", ", key)
+    key = re.sub(r"\s+", " ", key)
+    return key.strip(" ,")
+
+
+# ========== CACHE TABLE ==========
+CACHE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS geocode_cache (
+        address_key TEXT PRIMARY KEY,
+        lat REAL,
+        lng REAL,
+        status TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )
+'''
+
+_ready_lock = threading.Lock()
+_ready_caches: Set[str] = set()
+
+
+def ensure_cache_table(db_path: str = CACHE_DB_NAME):
+    """Create the cache table once per process; lookups then use the pooled connections"""
+    if db_path in _ready_caches:
+        return
+    with _ready_lock:
+        if db_path not in _ready_caches:
+            with writer(db_path) as conn:
+                conn.execute(CACHE_TABLE_SQL)
+            _ready_caches.add(db_path)
+
+
+def lookup_cached(addresses: Iterable[str], db_path: str = CACHE_DB_NAME) -> Dict[str, Coordinates]:
+    """Unexpired cache entries for the given addresses; never calls the geocoder.
+
+    Negative entries are returned as (None, None); uncached addresses are absent.
+    """
+    keys = {normalize_address(address): address for address in addresses}
+    if not keys:
+        return {}
+
+    ensure_cache_table(db_path)
+    conn = reader(db_path)
+    found = {}
+    key_list = list(keys)
+    for start in range(0, len(key_list), 500):  # Stay under SQLite's variable limit
+        chunk = key_list[start:start + 500]
+        cursor = conn.execute(
+            f"SELECT address_key, lat, lng FROM geocode_cache "
+            f"WHERE expires_at > ? AND address_key IN ({', '.join('?' * len(chunk))})",
+            [time.time()] + chunk
+        )
+        for key, lat, lng in cursor.fetchall():
+            found[keys[key]] = (lat, lng)
+    _count("cache_hits", len(found))
+    _count("cache_misses", len(keys) - len(found))
+    return found
+
+
+def save_results(results: Dict[str, Tuple[Optional[float], Optional[float], str]],
+                 db_path: str = CACHE_DB_NAME):
+    """Store {address: (lat, lng, status)} in one transaction.
+
+    Transient failures (rate limits, server errors) are not cached.
+    """
+    now = time.time()
+    entries = []
+    for address, (lat, lng, status) in results.items():
+        if status == "OK":
+            ttl = POSITIVE_TTL
+        elif status in NEGATIVE_STATUSES:
+            ttl = NEGATIVE_TTL
+        else:
+            continue
+        entries.append((normalize_address(address), lat, lng, status, now, now + ttl))
+
+    if not entries:
+        return
+    ensure_cache_table(db_path)
+    with writer(db_path) as conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO geocode_cache (address_key, lat, lng, status, fetched_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', entries)
+
+
+# ========== GEOCODER ==========
+def fetch_coordinates(address: str, session: Optional[requests.Session] = None,
+                      url: Optional[str] = None) -> Tuple[Optional[float], Optional[float], str]:
+    """Call the geocoder for one address; returns (lat, lng, status)"""
+    params = {"address": address, "key": GOOGLE_API_KEY}
+    _count("api_calls")
+    try:
+        response = (session or requests).get(url or GEOCODE_URL, params=params, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        _count("api_failures")
+        return None, None, f"ERROR: {e.__class__.__name__}"
+    if response.status_code != 200:
+        _count("api_failures")
+        return None, None, f"HTTP_{response.status_code}"
+
+    try:
+        data = response.json()
+        if data.get("status") == "OK":
+            location = data["results"][0]["geometry"]["location"]
+            return location["lat"], location["lng"], "OK"
+    except (ValueError, AttributeError, KeyError, IndexError, TypeError):
+        # HTML error page or unexpected shape: a failed (retryable) lookup, not a crash
+        _count("api_failures")
+        return None, None, "INVALID_RESPONSE"
+    _count("api_failures")
+    return None, None, data.get("status", "UNKNOWN")
+
+
+def get_coordinates(address: str, session: Optional[requests.Session] = None) -> Coordinates:
+    """Coordinates for an address, served from the cache when possible"""
+    cached = lookup_cached([address])
+    if address in cached:
+        return cached[address]
+
+    lat, lng, status = fetch_coordinates(address, session)
+    save_results({address: (lat, lng, status)})
+    return lat, lng
+
+
+# ========== BACKGROUND BACKFILL ==========
+def find_missing_coordinates(db_path: str = DB_NAME) -> List[Tuple[int, str]]:
+    """(id, address) of stores without usable coordinates"""
+    rows = reader(db_path).execute("SELECT id, address, lat, lng FROM stores").fetchall()
+    return [
+        (store_id, address)
+        for store_id, address, lat, lng in rows
+        if parse_coordinate(lat) is None or parse_coordinate(lng) is None
+    ]
+
+
+def write_coordinates(updates: List[Tuple[int, float, float]], db_path: str = DB_NAME):
+    """Write (id, lat, lng) back to the stores table in a single transaction"""
+    if not updates:
+        return
+    with writer(db_path) as conn:
+        conn.executemany(
+            "UPDATE stores SET lat = ?, lng = ?, waze_link = ? WHERE id = ?",
+            [(lat, lng, f"https://waze.com/ul?ll={lat},{lng}", store_id) for store_id, lat, lng in updates]
+        )
+
+
+def fill_missing_coordinates(db_path: str = DB_NAME) -> int:
+    """Geocode stores that lack coordinates and save them; returns how many were filled"""
+    missing = find_missing_coordinates(db_path)
+    if not missing:
+        return 0
+
+    # Cached coordinates are written straight back; cached negatives aren't retried until they expire
+    cached = lookup_cached(address for _, address in missing)
+    updates = [(store_id, *cached[address]) for store_id, address in missing
+               if cached.get(address, (None, None))[0] is not None]
+    pending = [(store_id, address) for store_id, address in missing if address not in cached]
+    with requests.Session() as session:
+        for store_id, address in pending:
+            lat, lng, status = fetch_coordinates(address, session)
+            save_results({address: (lat, lng, status)})
+            if lat is not None and lng is not None:
+                updates.append((store_id, lat, lng))
+    write_coordinates(updates, db_path)
+    return len(updates)
+
+
+FILL_MIN_INTERVAL = 60  # Seconds between background backfills, however many requests ask
+
+_fill_lock = threading.Lock()
+_last_fill = float("-inf")
+
+
+def schedule_fill_missing(db_path: str = DB_NAME) -> bool:
+    """Start a background backfill unless one is running or one started in the last FILL_MIN_INTERVAL"""
+    global _last_fill
+    if time.monotonic() - _last_fill < FILL_MIN_INTERVAL or not _fill_lock.acquire(blocking=False):
+        return False
+    _last_fill = time.monotonic()
+
+    def run():
+        try:
+            filled = fill_missing_coordinates(db_path)
+            if filled:
+                print(f"Geocoded {filled} stores with missing coordinates")
+        except Exception as e:
+            print(f"Background geocoding failed: {e}")
+        finally:
+            # The thread is about to exit; don't leave its readers in the pools
+            release_reader(db_path)
+            release_reader(CACHE_DB_NAME)
+            _fill_lock.release()
+
+    threading.Thread(target=run, name="geocode-backfill", daemon=True).start()
+    return True
@@ -1,47 +1,156 @@
-import requests
+import argparse
+import random
+import threading
 import time
-import sqlite3
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Google API Key from environment variable
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-# Function to get coordinates from Google Maps API
-def get_coordinates(address):
-    base_url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {"address": address, "key": GOOGLE_API_KEY}
-    response = requests.get(base_url, params=params)
-    data = response.json()
-    
-    if data["status"] == "OK":
-        location = data["results"][0]["geometry"]["location"]
-        return location["lat"], location["lng"]
-    return "N/A", "N/A"
-
-# Connect to the database
-conn = sqlite3.connect("mcdonalds_stores.db")
-cursor = conn.cursor()
-
-# Fetch all stored addresses
-cursor.execute("SELECT Name, Address FROM stores")
-stores = cursor.fetchall()
-
-# Process each store
-for store in stores:
-    name, address = store
-    lat, lng = get_coordinates(address)
-    
-    # Print store info
-    print(f"Store: {name}")
-    print(f"Address: {address}")
-    print(f"Lat: {lat}, Lng: {lng}")
-    print("-" * 50)
-    
-    time.sleep(1)  # Avoid hitting API rate limits
-
-# Close the database connection
-conn.close()
\ No newline at end of file
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from db import reader
+from geocode_cache import (
+    fetch_coordinates, is_transient, lookup_cached, normalize_address, save_results, write_coordinates
+)
+from store_cache import DB_NAME, parse_coordinate
+
+DEFAULT_QPS = 50  # Google Geocoding API default per-project limit
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` requests per second, bursts up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """HTTP session whose connection pool fits every worker"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def geocode_with_retry(address: str, session: requests.Session, limiter: TokenBucket,
+                       retries: int, url: Optional[str]) -> Tuple[Optional[float], Optional[float], str]:
+    """Geocode one address, backing off exponentially (with jitter) on transient errors"""
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        lat, lng, status = fetch_coordinates(address, session, url)
+        if not is_transient(status) or attempt == retries:
+            return lat, lng, status
+        time.sleep(min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0))
+    return None, None, "UNKNOWN"
+
+
+def load_targets(db_path: str, missing_only: bool) -> List[Tuple[int, str, str, tuple]]:
+    """(id, name, address, current coordinates) of the stores to geocode"""
+    rows = reader(db_path).execute("SELECT id, name, address, lat, lng FROM stores ORDER BY id").fetchall()
+    targets = [
+        (store_id, name, address, (parse_coordinate(lat), parse_coordinate(lng)))
+        for store_id, name, address, lat, lng in rows
+    ]
+    if missing_only:
+        targets = [target for target in targets if None in target[3]]
+    return targets
+
+
+def run_pipeline(db_path: str = DB_NAME, qps: float = DEFAULT_QPS, workers: int = 8, retries: int = 4,
+                 batch_size: int = 100, missing_only: bool = False, url: Optional[str] = None,
+                 verbose: bool = True) -> dict:
+    """Geocode stores concurrently and write coordinates back to the stores table.
+
+    Results are saved to the geocode cache batch by batch, so an interrupted
+    run resumes where it left off; the stores table is updated in a single
+    transaction at the end.
+    """
+    started = time.perf_counter()
+    targets = load_targets(db_path, missing_only)
+
+    # Resume: anything already in the cache needs no API call
+    cached = lookup_cached(target[2] for target in targets)
+    results = {normalize_address(address): coords for address, coords in cached.items()}
+    # One call per distinct address, however many stores share it
+    pending = list({
+        normalize_address(target[2]): target[2] for target in targets if target[2] not in cached
+    }.values())
+    failed = 0
+
+    limiter = TokenBucket(qps)
+    with make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            fetched = list(pool.map(
+                lambda address: geocode_with_retry(address, session, limiter, retries, url), batch
+            ))
+            save_results(dict(zip(batch, fetched)))
+            for address, (lat, lng, status) in zip(batch, fetched):
+                results[normalize_address(address)] = (lat, lng)
+                if status != "OK":
+                    failed += 1
+            if verbose:
+                print(f"Geocoded {min(start + batch_size, len(pending))}/{len(pending)} addresses")
+
+    updates = []
+    for store_id, name, address, current in targets:
+        lat, lng = results.get(normalize_address(address), (None, None))
+        if verbose:
+            print(f"Store: {name}")
+            print(f"Address: {address}")
+            print(f"Lat: {lat if lat is not None else 'N/A'}, Lng: {lng if lng is not None else 'N/A'}")
+            print("-" * 50)
+        if lat is not None and lng is not None and (lat, lng) != current:
+            updates.append((store_id, lat, lng))
+    write_coordinates(updates, db_path)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "stores": len(targets),
+        "api_calls": len(pending),
+        "cache_hits": sum(target[2] in cached for target in targets),
+        "failed": failed,
+        "updated": len(updates),
+        "seconds": round(elapsed, 3),
+        "addresses_per_second": round(len(pending) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Geocode store addresses and save their coordinates")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--qps", type=float, default=DEFAULT_QPS, help="Provider rate limit")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--missing-only", action="store_true", help="Skip stores that already have coordinates")
+    parser.add_argument("--url", help="Geocoder endpoint, e.g. a stub_servers.py geocoder")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    stats = run_pipeline(args.db, args.qps, args.workers, args.retries, args.batch_size,
+                         args.missing_only, args.url, verbose=not args.quiet)
+    print(f"Geocoded {stats['api_calls']} addresses ({stats['cache_hits']} cached, {stats['failed']} failed) "
+          f"in {stats['seconds']}s: {stats['addresses_per_second']} addresses/s, "
+          f"{stats['updated']} stores updated")
+
+
+if __name__ == "__main__":
+    main()
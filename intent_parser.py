@@ -0,0 +1,223 @@
+import re
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from location_search import fts_match
+from opening_hours import DAY_PATTERN, CLOCK_PATTERN, resolve_time
+
+# Parser answers are used only at or above this confidence; below it the LLM runs.
+# Each unrecognised word costs 0.25, so any word the parser can't place goes to the LLM.
+CONFIDENCE_THRESHOLD = 1.0
+
+# Feature phrases -> stores column
+FEATURE_PATTERNS = [
+    (r"24\s*-?\s*(?:hours?|hrs?|h)\b|24/7|round the clock|all night|never close", "is_24h"),
+    (r"birthday(?: part(?:y|ies))?|part(?:y|ies)", "has_birthday_party"),
+    (r"breakfast|morning menu", "has_breakfast"),
+    (r"cashless(?: facility| payments?)?|card payments?|e-?wallets?", "has_cashless"),
+    (r"dessert(?: cent(?:er|re)s?| kiosks?)?|ice cream|sundaes?", "has_dessert_center"),
+    (r"(?:digital |self[- ]?)?(?:order(?:ing)? )?kiosks?|self[- ]?order(?:ing)?", "has_digital_kiosk"),
+    (r"mc\s*caf[eé]|coffee|caf[eé]", "has_mccafe"),
+    (r"wi-?fi|internet", "has_wifi"),
+    (r"mc\s*delivery|delivery|deliver", "has_mcdelivery"),
+]
+_FEATURE_REGEX = [(re.compile(rf"\b(?:{pattern})"), column) for pattern, column in FEATURE_PATTERNS]
+
+# "open now", "currently open", "open at 2am", "open on sunday at 9pm", "open at 10" (24-hour clock)
+# -> an "open:<minute of week>" token
+_OPEN_REGEX = re.compile(
+    rf"\b(?:(?:currently|still) open|open(?:ed)? (?:right )?now)\b"
+    rf"|\bopen(?:ed)?\s+(?P<spec>(?:(?:on|at|by|around)\s+)?(?:(?:{DAY_PATTERN})\s*(?:at\s+)?)?{CLOCK_PATTERN}"
+    rf"(?:\s+(?:on\s+)?(?:{DAY_PATTERN}))?)"
+    rf"|\bopen(?:ed)?\s+(?:at|by|around)\s+(?P<hour>\d{{1,2}})\b"
+)
+
+NEGATIONS = {"without", "no", "not", "dont", "doesnt", "don't", "doesn't", "excluding", "except", "lacking", "lack"}
+POSITIVE_MARKERS = {"with", "but", "plus", "having"}
+CONJUNCTIONS = {"and", "&", "also"}
+DISJUNCTIONS = {"or"}
+LOCATION_PREPOSITIONS = {"in", "near", "around", "at", "within", "inside", "nearby"}
+BRAND_WORDS = {"mcdonald's", "mcdonalds", "mcd", "mcds", "macdonald's", "mcdonald"}
+
+# Words that carry no constraint in a store search
+FILLER_WORDS = {
+    "which", "what", "where", "whats", "outlet", "outlets", "store", "stores", "location", "locations",
+    "branch", "branches", "restaurant", "restaurants", "show", "me", "list", "find", "give", "get",
+    "tell", "all", "any", "the", "a", "an", "are", "is", "there", "do", "does", "that", "have", "has",
+    "offer", "offers", "offering", "provide", "provides", "providing", "support", "supports", "serve",
+    "serves", "serving", "allow", "allows", "allowing", "operate", "operates", "operating", "open",
+    "opened", "can", "i", "please", "of", "for", "to", "ones", "one", "available", "facilities",
+    "facility", "features", "feature", "services", "service", "details", "detail", "info", "information",
+    "about", "hold", "host", "celebrate", "throw", "you", "some", "places", "place", "need", "want",
+    "looking", "look", "them", "it", "its", "their", "every", "each", "who",
+}
+_IGNORED_IN_PHRASE = FILLER_WORDS | CONJUNCTIONS | DISJUNCTIONS | POSITIVE_MARKERS | NEGATIONS
+
+
+class Intent(NamedTuple):
+    clauses: List[List[Tuple[str, bool]]]  # AND of ORs: [[("has_wifi", True)], ...]
+    locations: List[List[str]]  # AND of ORs: [["kuala lumpur", "pj"], ...]
+    names: List[str]
+    unknown: List[str]
+    confidence: float
+    open_at: Optional[int] = None  # Minute of the week (opening_hours.resolve_time)
+    excluded_locations: List[str] = []  # "not in kl"
+
+
+def _open_token(match: re.Match, now: Optional[datetime]) -> str:
+    spec = match.group("spec") or (f"{match.group('hour')}:00" if match.group("hour") else "now")
+    try:
+        return f" open:{resolve_time(spec, now)} "
+    except ValueError:
+        return match.group(0)
+
+
+def _tokenize(query: str, now: Optional[datetime] = None) -> List[str]:
+    """Lowercase tokens, with each feature phrase collapsed to a "feature:<column>" token
+    and each opening-time phrase to an "open:<minute>" token"""
+    text = query.lower().strip()
+    text = re.sub(r"\bkl\b", "kuala lumpur", text)
+    text = _OPEN_REGEX.sub(lambda match: _open_token(match, now), text)
+    for regex, column in _FEATURE_REGEX:
+        text = regex.sub(f" feature:{column} ", text)
+    return re.findall(r"feature:\w+|open:\d+|[a-z0-9][a-z0-9'./-]*|&", text)
+
+
+def _phrase_end(tokens: List[str], start: int) -> int:
+    """Index just past the location/name phrase starting at ``start``"""
+    end = start
+    while end < len(tokens) and not tokens[end].startswith(("feature:", "open:")) \
+            and tokens[end] not in _IGNORED_IN_PHRASE \
+            and tokens[end] not in LOCATION_PREPOSITIONS and tokens[end] not in BRAND_WORDS:
+        end += 1
+    return end
+
+
+def parse_intent(query: str, now: Optional[datetime] = None) -> Intent:
+    """Rule-based parse of a store search into feature, location, name and opening-time constraints"""
+    tokens = _tokenize(query, now)
+    clauses: List[List[Tuple[str, bool]]] = []
+    locations: List[List[str]] = []
+    names: List[str] = []
+    unknown: List[str] = []
+    open_at: Optional[int] = None
+    excluded_locations: List[str] = []
+
+    # A negation covers only the next feature or phrase ("without wifi but breakfast")
+    negate = False
+    join_or = False
+    # "in kl or pj": an "or" right after a location adds an alternative to it
+    after_location = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+
+        if token.startswith("feature:"):
+            constraint = (token.split(":", 1)[1], not negate)
+            if join_or and clauses:
+                clauses[-1].append(constraint)
+            else:
+                clauses.append([constraint])
+            join_or = False
+            # "without wifi or breakfast": the negation carries across an "or" only
+            negate = negate and i + 1 < len(tokens) and tokens[i + 1] in DISJUNCTIONS
+            after_location = False
+            i += 1
+            continue
+
+        if join_or and after_location and not negate and token not in _IGNORED_IN_PHRASE \
+                and not token.startswith("open:") and token not in BRAND_WORDS:
+            # "in kl or [in] pj"
+            start = i + 1 if token in LOCATION_PREPOSITIONS else i
+            end = _phrase_end(tokens, start)
+            phrase = [word for word in (word.strip("'.,") for word in tokens[start:end]) if word]
+            if phrase and not (token == "at" and phrase[0][0].isdigit()):
+                locations[-1].append(" ".join(phrase))
+                join_or = False
+                i = end
+                continue
+
+        if token.startswith("open:"):
+            open_at = int(token.split(":", 1)[1])
+        elif token in NEGATIONS:
+            negate = True
+        elif token in POSITIVE_MARKERS:
+            negate = False
+        elif token in DISJUNCTIONS:
+            join_or = True
+        elif token in LOCATION_PREPOSITIONS or token in BRAND_WORDS:
+            # "in bangsar" -> location, "mcdonald's bukit bintang" -> store name
+            j = _phrase_end(tokens, i + 1)
+            phrase = [word for word in (word.strip("'.,") for word in tokens[i + 1:j]) if word]
+            after_location = False
+            if token == "at" and phrase and phrase[0][0].isdigit():
+                # "at 10", "at 53300": a time or a postcode; leave it to the LLM
+                unknown.append(" ".join(phrase))
+            elif phrase and phrase != ["me"]:
+                if not negate and token in LOCATION_PREPOSITIONS:
+                    locations.append([" ".join(phrase)])
+                    after_location = True
+                elif not negate:
+                    names.append(" ".join(phrase))
+                elif token in LOCATION_PREPOSITIONS:
+                    excluded_locations.append(" ".join(phrase))
+                else:
+                    # "not mcdonald's bangsar": unclear intent, leave it to the LLM
+                    unknown.append("not " + " ".join(phrase))
+            negate = False
+            join_or = False
+            i = j
+            continue
+        elif token not in FILLER_WORDS and token not in CONJUNCTIONS:
+            unknown.append(token)
+            after_location = False
+        i += 1
+
+    matched = bool(clauses or locations or names or excluded_locations or open_at is not None)
+    confidence = max(0.0, 1.0 - 0.25 * len(unknown)) if matched else 0.0
+    return Intent(clauses, locations, names, unknown, confidence, open_at, excluded_locations)
+
+
+def compile_intent(intent: Intent) -> Tuple[str, tuple]:
+    """Parameterized SQL for an intent"""
+    conditions: List[str] = []
+    params: List = []
+
+    for clause in intent.clauses:
+        parts = []
+        for column, wanted in clause:
+            # Every feature (is_24h included) is an indexed 0/1 column
+            parts.append(f"{column} = ?")
+            params.append(1 if wanted else 0)
+        conditions.append(parts[0] if len(parts) == 1 else f"({' OR '.join(parts)})")
+
+    if intent.open_at is not None:
+        conditions.append("is_open_at(weekly_hours, ?) = 1")
+        params.append(intent.open_at)
+
+    # Locations and names go through the stores_fts full-text index
+    for phrases, column, operator in [(alternatives, None, "IN") for alternatives in intent.locations] + \
+            [([name], "name", "IN") for name in intent.names] + \
+            [([location], None, "NOT IN") for location in intent.excluded_locations]:
+        expressions = [expression for expression in (fts_match(phrase, column) for phrase in phrases) if expression]
+        expression = " OR ".join(expressions)
+        if expression:
+            conditions.append(f"id {operator} (SELECT rowid FROM stores_fts WHERE stores_fts MATCH ?)")
+            params.append(expression)
+
+    sql = "SELECT * FROM stores"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql, tuple(params)
+
+
+def confident_intent(query: str) -> Optional[Intent]:
+    """The parsed intent when the parser is confident about the query, else None"""
+    intent = parse_intent(query)
+    return intent if intent.confidence >= CONFIDENCE_THRESHOLD else None
+
+
+def rule_based_sql(query: str) -> Optional[Tuple[str, tuple]]:
+    """(sql, params) when the parser is confident about the query, else None"""
+    intent = confident_intent(query)
+    return compile_intent(intent) if intent else None
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import httpx
+
+# Together completions endpoint; point at stub_servers.py's llm stub for load tests
+TOGETHER_API_URL = os.getenv("TOGETHER_API_URL", "https://api.together.xyz/v1/completions")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "8"))  # Per-call deadline, seconds
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))  # Waiting callers beyond this are shed
+# Send a hedged duplicate once a call outlives this latency percentile (0 disables)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+HEDGE_MIN_SAMPLES = 20
+
+
+class LLMOverloaded(Exception):
+    """Too many LLM calls in flight and queued; the caller should shed the request"""
+
+
+class LLMTimeout(Exception):
+    """The LLM did not answer before the deadline"""
+
+
+class AsyncLLMClient:
+    """Async completion client with deadlines, bounded concurrency and optional hedging"""
+
+    def __init__(self, api_key: Optional[str], url: str = TOGETHER_API_URL, timeout: float = LLM_TIMEOUT,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 hedge_percentile: float = LLM_HEDGE_PERCENTILE):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.hedge_percentile = hedge_percentile
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._waiting = 0
+        self._in_flight = 0
+        self._latencies: deque = deque(maxlen=500)
+        self.counters = {"calls": 0, "errors": 0, "timeouts": 0, "shed": 0, "hedges": 0, "hedge_wins": 0}
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency * 2),
+                headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else None,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def hedge_delay(self) -> Optional[float]:
+        """Latency percentile after which a hedged request is sent, if enabled"""
+        if not self.hedge_percentile or len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return ordered[index]
+
+    async def _post(self, payload: Dict) -> Dict:
+        started = time.perf_counter()
+        response = await self._http().post(self.url, json=payload)
+        response.raise_for_status()
+        self._latencies.append(time.perf_counter() - started)
+        return response.json()
+
+    async def _hedged(self, payload: Dict) -> Dict:
+        primary = asyncio.ensure_future(self._post(payload))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        # Only hedge with a spare slot, so hedging never adds to overload
+        if done or self._semaphore.locked():
+            return await primary
+
+        await self._semaphore.acquire()
+        self.counters["hedges"] += 1
+        backup = asyncio.ensure_future(self._post(payload))
+        try:
+            pending = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+            return primary.result()  # Both failed: surface the primary's error
+        finally:
+            for task in (primary, backup):
+                task.cancel()
+            self._semaphore.release()
+
+    async def complete(self, payload: Dict) -> Dict:
+        """POST a completion request; raises LLMOverloaded, LLMTimeout or httpx errors"""
+        self._http()
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self.counters["shed"] += 1
+            raise LLMOverloaded()
+
+        deadline = time.monotonic() + self.timeout
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise LLMTimeout()
+        finally:
+            self._waiting -= 1
+
+        self.counters["calls"] += 1
+        self._in_flight += 1
+        try:
+            # Time spent queueing counts against the same deadline
+            return await asyncio.wait_for(self._hedged(payload), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise LLMTimeout()
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return dict(self.counters, in_flight=self._in_flight, waiting=self._waiting, hedge_delay=self.hedge_delay())
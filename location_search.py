@@ -0,0 +1,95 @@
+import re
+from typing import List, Optional
+
+# Malaysian postcode ranges -> state (first postcode, last postcode, state)
+POSTCODE_STATES = [
+    (1000, 2800, "perlis"),
+    (5000, 9810, "kedah"),
+    (10000, 14400, "penang pulau pinang"),
+    (15000, 18500, "kelantan"),
+    (20000, 24300, "terengganu"),
+    (25000, 28800, "pahang"),
+    (30000, 36810, "perak"),
+    (39000, 39200, "pahang"),
+    (40000, 48300, "selangor"),
+    (49000, 49000, "pahang"),
+    (50000, 60000, "kuala lumpur wilayah persekutuan"),
+    (62000, 62988, "putrajaya wilayah persekutuan"),
+    (63000, 68100, "selangor"),
+    (69000, 69000, "pahang"),
+    (70000, 73509, "negeri sembilan"),
+    (75000, 78309, "melaka malacca"),
+    (79000, 86900, "johor"),
+    (87000, 87033, "labuan wilayah persekutuan"),
+    (88000, 91309, "sabah"),
+    (93000, 98859, "sarawak"),
+]
+
+# Short names people use for an area, added as extra tokens
+AREA_ALIASES = {
+    "kuala lumpur": "kl",
+    "petaling jaya": "pj",
+    "johor bahru": "jb",
+    "kota kinabalu": "kk",
+}
+
+# Shorter trailing words are matched exactly ("kl" must not match "klia")
+PREFIX_MIN_LENGTH = 4
+
+
+def area_tokens(address: Optional[str]) -> str:
+    """Derived search terms for an address: postcode, city, state and aliases.
+
+    "..., 53300 Kuala Lumpur." -> "53300 kuala lumpur wilayah persekutuan kl"
+    """
+    if not address:
+        return ""
+    tokens: List[str] = []
+    parts = [part.strip(" .").lower() for part in address.split(",")]
+    # Postcode/city/state part: from the postcode on, or the last part when there is none
+    locality = parts[-1:]
+    for i, part in enumerate(parts):
+        match = re.match(r"(\d{5})\b\s*(.*)", part)
+        if not match:
+            continue
+        # "53300 Kuala Lumpur" or "59100, Bangsar Baru, ..." (city in the next part)
+        postcode, city = match.group(1), match.group(2).strip()
+        if not city and i + 1 < len(parts):
+            city = parts[i + 1]
+        locality = parts[i:]
+        tokens.append(postcode)
+        if city:
+            tokens.append(city)
+        code = int(postcode)
+        tokens.extend(state for first, last, state in POSTCODE_STATES if first <= code <= last)
+        break
+
+    # Street and building names don't count: "Kuala Lumpur International Airport, 64000 Sepang" isn't KL
+    text = " ".join(re.findall(r"[^\W_]+", " ".join(locality + tokens)))
+    tokens.extend(alias for name, alias in AREA_ALIASES.items() if re.search(rf"\b{name}\b", text))
+    return " ".join(tokens)
+
+
+def postcode_state(address: Optional[str]) -> Optional[str]:
+    """POSTCODE_STATES name for the address's postcode ("penang pulau pinang"), or None without one"""
+    for part in (address or "").split(","):
+        match = re.match(r"(\d{5})\b", part.strip(" ."))
+        if match:
+            code = int(match.group(1))
+            return next((state for first, last, state in POSTCODE_STATES if first <= code <= last), None)
+    return None
+
+
+def fts_match(phrase: str, column: Optional[str] = None) -> Optional[str]:
+    """FTS5 MATCH expression for a location or name phrase, or None if it has no words.
+
+    The words must appear in order; the last one may be a prefix ("bangs" ->
+    bangsar, "533" -> 53300) unless it is a short word or a full postcode.
+    """
+    words = re.findall(r"[^\W_]+", phrase.lower())
+    if not words:
+        return None
+    last = words[-1]
+    prefix = len(last) >= PREFIX_MIN_LENGTH if not last.isdigit() else len(last) < 5
+    expression = f'"{" ".join(words)}"' + ("*" if prefix else "")
+    return f"{column} : {expression}" if column else expression
@@ -26,10 +26,19 @@ const McDonaldsMap = () => {
       .then(data => {
         if (data.stores) {
           setStores(data.stores);
-          findIntersections(data.stores);
         }
       })
       .catch(error => console.error("Error fetching data:", error));
+
+    // Overlapping coverage areas are precomputed by the API
+    fetch(`${API_BASE_URL}/stores/overlaps?radius=${RADIUS}`)
+      .then(response => response.json())
+      .then(data => {
+        if (data.intersected) {
+          setIntersectedStores(new Set(data.intersected));
+        }
+      })
+      .catch(error => console.error("Error fetching overlaps:", error));
   }, []);
 
   // Auto-scroll chat to bottom
@@ -37,38 +46,6 @@ const McDonaldsMap = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [chatMessages]);
 
-  // Calculate distance between stores
-  const haversineDistance = (lat1, lon1, lat2, lon2) => {
-    const R = 6371000;
-    const toRad = angle => (Math.PI / 180) * angle;
-    const dLat = toRad(lat2 - lat1);
-    const dLon = toRad(lon2 - lon1);
-    const a = Math.sin(dLat / 2) * Math.sin(dLat / 2) +
-              Math.cos(toRad(lat1)) * Math.cos(toRad(lat2)) *
-              Math.sin(dLon / 2) * Math.sin(dLon / 2);
-    return R * (2 * Math.atan2(Math.sqrt(a), Math.sqrt(1 - a)));
-  };
-
-  // Find stores with overlapping coverage areas
-  const findIntersections = (stores) => {
-    const intersected = new Set();
-    stores.forEach((storeA, indexA) => {
-      stores.forEach((storeB, indexB) => {
-        if (indexA !== indexB) {
-          const distance = haversineDistance(
-            parseFloat(storeA.latitude), parseFloat(storeA.longitude),
-            parseFloat(storeB.latitude), parseFloat(storeB.longitude)
-          );
-          if (distance <= RADIUS * 2) {
-            intersected.add(storeA.name);
-            intersected.add(storeB.name);
-          }
-        }
-      });
-    });
-    setIntersectedStores(intersected);
-  };
-
   // Handle marker click on map
   const handleMarkerClick = (store) => {
     if (selectedLocation && selectedLocation.lat === parseFloat(store.latitude) && 
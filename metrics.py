@@ -0,0 +1,273 @@
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from starlette.routing import Match
+
+# Latency buckets in seconds (Prometheus "le" bounds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NAMESPACE = "mcd"
+
+# Opt-in sampling profiler: profile a PROFILE_SAMPLE_RATE share of requests and
+# report the ones slower than PROFILE_SLOW_MS (0 disables)
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.1"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_TOP_STACKS = 10
+PROFILE_STACK_DEPTH = 8
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+# ========== METRIC TYPES ==========
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels"""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: Dict[Labels, List] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                yield f"{self.name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {count}"
+            yield f"{self.name}_bucket{_format_labels(labels, ('le', '+Inf'))} {values[-1]}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(values[-2])}"
+            yield f"{self.name}_count{_format_labels(labels)} {values[-1]}"
+
+
+class CounterMetric:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+
+
+# Samples are (labels, {stat: value}) pairs from a component's existing stats()
+CollectorFn = Callable[[], Iterable[Tuple[Dict[str, str], Dict]]]
+
+
+class Registry:
+    """Metrics owned here plus collectors that read the components' own counters at scrape time"""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, CollectorFn, frozenset]] = []
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(f"{NAMESPACE}_{name}", help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str) -> CounterMetric:
+        metric = CounterMetric(f"{NAMESPACE}_{name}", help)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, prefix: str, collect: CollectorFn, gauges: Iterable[str] = ()):
+        """Expose ``collect()``'s numeric stats as ``<prefix>_<stat>``; stats not in ``gauges`` are counters"""
+        self._collectors.append((prefix, collect, frozenset(gauges)))
+
+    def _render_collector(self, prefix: str, collect: CollectorFn, gauges: frozenset) -> Iterator[str]:
+        try:
+            samples = list(collect())
+        except Exception as e:
+            print(f"Metrics collector {prefix} failed: {e}")
+            return
+        series: Dict[str, List[Tuple[Labels, float]]] = {}
+        for labels, stats in samples:
+            for stat, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    series.setdefault(stat, []).append((tuple(sorted(labels.items())), value))
+        for stat, values in series.items():
+            is_gauge = stat in gauges
+            name = f"{NAMESPACE}_{prefix}_{stat}" + ("" if is_gauge else "_total")
+            yield f"# TYPE {name} {'gauge' if is_gauge else 'counter'}"
+            for labels, value in values:
+                yield f"{name}{_format_labels(labels)} {_format_value(value)}"
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, collect, gauges in self._collectors:
+            lines.extend(self._render_collector(prefix, collect, gauges))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram("request_duration_seconds", "HTTP request latency by route and status")
+STAGE_SECONDS = registry.histogram("stage_duration_seconds", "Time spent in each pipeline stage")
+SLOW_REQUESTS = registry.counter("slow_requests_profiled_total", "Sampled requests slower than PROFILE_SLOW_MS")
+
+
+# ========== SPANS ==========
+_endpoint: ContextVar[str] = ContextVar("metrics_endpoint", default="")
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage of the current request into STAGE_SECONDS"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, endpoint=_endpoint.get(), stage=stage)
+
+
+# ========== SAMPLING PROFILER ==========
+class StackSampler:
+    """Background thread counting the stacks of every other thread at a fixed interval"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="StackSampler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[" <- ".join(stack)] += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+def print_slow_request(endpoint: str, seconds: float, samples: Counter):
+    """Default slow-request hook: the most frequently sampled stacks"""
+    print(f"Slow request {endpoint}: {seconds * 1000:.0f} ms, {sum(samples.values())} samples")
+    for stack, count in samples.most_common(PROFILE_TOP_STACKS):
+        print(f"  {count:5d}  {stack}")
+
+
+# Called with (endpoint, seconds, stack samples) for each profiled slow request
+slow_request_hook: Callable[[str, float, Counter], None] = print_slow_request
+
+
+def set_slow_request_hook(hook: Callable[[str, float, Counter], None]):
+    global slow_request_hook
+    slow_request_hook = hook
+
+
+# ========== MIDDLEWARE ==========
+class MetricsMiddleware:
+    """ASGI middleware timing every request by route template and status"""
+
+    def __init__(self, app, slow_ms: float = PROFILE_SLOW_MS, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+
+    def _route(self, scope) -> str:
+        # The template ("/stores/tiles/{z}/{x}/{y}") keeps label cardinality bounded
+        router = getattr(scope.get("app"), "router", None)
+        for route in getattr(router, "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._route(scope)
+        token = _endpoint.set(endpoint)
+        status = {"code": 500}
+        sampler = None
+        if self.slow_ms and random.random() < self.sample_rate:
+            sampler = StackSampler().start()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _endpoint.reset(token)
+            REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=scope["method"], status=str(status["code"]))
+            if sampler is not None:
+                samples = sampler.stop()
+                if elapsed * 1000 >= self.slow_ms:
+                    SLOW_REQUESTS.inc(endpoint=endpoint)
+                    slow_request_hook(endpoint, elapsed, samples)
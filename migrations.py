@@ -0,0 +1,201 @@
+import argparse
+import sqlite3
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from db import DB_NAME, writer
+from location_search import area_tokens
+from opening_hours import encode_hours, parse_hours
+from store_cache import FEATURE_BITS, FEATURE_COLUMNS, STORE_COLUMNS
+
+# ========== DERIVED COLUMNS ==========
+IS_24H_SQL = "(operating_hours LIKE '%24 Hours%')"
+
+# Packed feature bitmask, bit-compatible with store_cache.FEATURE_BITS
+FEATURES_SQL = " + ".join(
+    [f"(COALESCE({column}, 0) != 0) * {FEATURE_BITS[name]}" for name, column in FEATURE_COLUMNS.items()]
+    + [f"{IS_24H_SQL} * {FEATURE_BITS['24_hours']}"]
+)
+
+# Coordinates that aren't numbers ("N/A", "") become NULL; REAL affinity converts the rest
+DERIVED_SET_SQL = f"""
+    lat = CASE WHEN typeof(lat) IN ('real', 'integer') THEN lat END,
+    lng = CASE WHEN typeof(lng) IN ('real', 'integer') THEN lng END,
+    is_24h = {IS_24H_SQL},
+    features = {FEATURES_SQL}
+"""
+
+TYPED_STORES_SQL = f'''
+    CREATE TABLE stores_typed (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        address TEXT,
+        lat REAL,
+        lng REAL,
+        operating_hours TEXT,
+        waze_link TEXT,
+        telephone TEXT,
+        email TEXT,
+        {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in FEATURE_COLUMNS.values())},
+        content_hash TEXT,
+        features INTEGER NOT NULL DEFAULT 0,  -- Bitmask of FEATURE_BITS (kept by triggers)
+        is_24h INTEGER NOT NULL DEFAULT 0,  -- Derived from operating_hours (kept by triggers)
+        UNIQUE(name, address)  -- Prevents duplicate stores
+    )
+'''
+
+# Old text-typed view of the table ("N/A" for missing coordinates)
+def legacy_view_sql(extra_columns: Sequence[str] = ()) -> str:
+    return f'''
+    CREATE VIEW stores_legacy AS
+    SELECT id, name, address,
+           COALESCE(CAST(lat AS TEXT), 'N/A') AS lat,
+           COALESCE(CAST(lng AS TEXT), 'N/A') AS lng,
+           operating_hours, waze_link, telephone, email,
+           {", ".join(list(FEATURE_COLUMNS.values()) + list(extra_columns))},
+           content_hash
+    FROM stores
+'''
+
+
+# Full-text index over name, address and derived area terms (external content: stores)
+FTS_SQL = '''
+    CREATE VIRTUAL TABLE stores_fts USING fts5(
+        name, address, area,
+        content = 'stores', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+'''
+
+FTS_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER stores_fts_insert AFTER INSERT ON stores BEGIN
+        INSERT INTO stores_fts (rowid, name, address, area) VALUES (NEW.id, NEW.name, NEW.address, NEW.area);
+    END
+    ''',
+    '''
+    CREATE TRIGGER stores_fts_delete AFTER DELETE ON stores BEGIN
+        INSERT INTO stores_fts (stores_fts, rowid, name, address, area)
+        VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.area);
+    END
+    ''',
+    '''
+    CREATE TRIGGER stores_fts_update AFTER UPDATE OF name, address, area ON stores BEGIN
+        INSERT INTO stores_fts (stores_fts, rowid, name, address, area)
+        VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.area);
+        INSERT INTO stores_fts (rowid, name, address, area) VALUES (NEW.id, NEW.name, NEW.address, NEW.area);
+    END
+    ''',
+]
+
+
+# ========== MIGRATIONS ==========
+def typed_stores(conn: sqlite3.Connection):
+    """REAL coordinates, features bitmask, is_24h, filter indexes, stores_legacy view"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(stores)")}
+    copied = [column for column in STORE_COLUMNS + ["content_hash"] if column in columns]
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'stores'").fetchone()
+
+    conn.execute(TYPED_STORES_SQL)
+    conn.execute(f"INSERT INTO stores_typed ({', '.join(copied)}) SELECT {', '.join(copied)} FROM stores")
+    conn.execute("DROP TABLE stores")
+    conn.execute("ALTER TABLE stores_typed RENAME TO stores")
+    if sequence:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'stores'", sequence)
+    conn.execute(f"UPDATE stores SET {DERIVED_SET_SQL}")
+
+    # Recompute derived columns whenever their inputs change
+    watched = ", ".join(["lat", "lng", "operating_hours"] + list(FEATURE_COLUMNS.values()))
+    conn.execute(f'''
+        CREATE TRIGGER stores_derived_insert AFTER INSERT ON stores
+        BEGIN UPDATE stores SET {DERIVED_SET_SQL} WHERE id = NEW.id; END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER stores_derived_update AFTER UPDATE OF {watched} ON stores
+        BEGIN UPDATE stores SET {DERIVED_SET_SQL} WHERE id = NEW.id; END
+    ''')
+
+    for column in list(FEATURE_COLUMNS.values()) + ["is_24h", "features"]:
+        conn.execute(f"CREATE INDEX idx_stores_{column} ON stores({column})")
+    conn.execute("CREATE INDEX idx_stores_lat_lng ON stores(lat, lng)")
+    conn.execute(legacy_view_sql())
+
+
+def full_text_search(conn: sqlite3.Connection):
+    """`area` column (postcode/city/state/aliases, set by the scraper) and the stores_fts index"""
+    conn.execute("ALTER TABLE stores ADD COLUMN area TEXT")
+    conn.executemany(
+        "UPDATE stores SET area = ? WHERE id = ?",
+        [(area_tokens(address), store_id) for store_id, address in conn.execute("SELECT id, address FROM stores")]
+    )
+    conn.execute(FTS_SQL)
+    for trigger in FTS_TRIGGERS_SQL:
+        conn.execute(trigger)
+    conn.execute("INSERT INTO stores_fts (stores_fts) VALUES ('rebuild')")
+
+
+def opening_hours(conn: sqlite3.Connection):
+    """`weekly_hours`: open intervals as minutes of the week (JSON, NULL when unknown), set by the scraper"""
+    conn.execute("ALTER TABLE stores ADD COLUMN weekly_hours TEXT")
+    # Only "24 Hours" was scraped before; parse_hours leaves "N/A" unknown
+    conn.executemany(
+        "UPDATE stores SET weekly_hours = ? WHERE id = ?",
+        [(encode_hours(parse_hours(hours)), store_id)
+         for store_id, hours in conn.execute("SELECT id, operating_hours FROM stores")]
+    )
+    conn.execute("DROP VIEW IF EXISTS stores_legacy")
+    conn.execute(legacy_view_sql(["weekly_hours"]))
+
+
+# (version, name, step); append only, never reorder
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "typed_stores", typed_stores),
+    (2, "full_text_search", full_text_search),
+    (3, "opening_hours", opening_hours),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path: str = DB_NAME, target: int = LATEST_VERSION) -> int:
+    """Apply pending migrations up to ``target``, each in its own transaction; returns the version"""
+    with writer(db_path) as conn:
+        version = schema_version(conn)
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stores'").fetchone():
+            return version  # Nothing to migrate until create_database() has run
+
+    for number, name, step in MIGRATIONS:
+        if version < number <= target:
+            with writer(db_path) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # Another process may have applied it while we waited for the lock
+                version = schema_version(conn)
+                if version >= number:
+                    continue
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            print(f"Applied migration {number}: {name}")
+            version = number
+    return version
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Upgrade the stores database schema")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--status", action="store_true", help="Only print the current schema version")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        conn = sqlite3.connect(args.db)
+        try:
+            print(f"Schema version {schema_version(conn)} (latest {LATEST_VERSION})")
+        finally:
+            conn.close()
+        return
+    print(f"Schema version {migrate(args.db)}")
+
+
+if __name__ == "__main__":
+    main()
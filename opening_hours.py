@@ -0,0 +1,293 @@
+import bisect
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+# Outlet hours are local time; Malaysia has no daylight saving, so a fixed
+# offset is an exact fallback when the tz database isn't installed
+TIMEZONE_NAME = "Asia/Kuala_Lumpur"
+try:
+    from zoneinfo import ZoneInfo
+    TIMEZONE = ZoneInfo(TIMEZONE_NAME)
+except Exception:
+    TIMEZONE = timezone(timedelta(hours=8), "MYT")
+
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+DAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Sorted, non-overlapping [start, end) minutes of the week; minute 0 is Monday 00:00
+Intervals = Tuple[Tuple[int, int], ...]
+ALL_WEEK: Intervals = ((0, WEEK_MINUTES),)
+
+CLOCK_PATTERN = r"(?:\d{1,2}[:.]\d{2}\s*(?:[ap]\.?m\.?)?|\d{1,2}\s*[ap]\.?m\.?|midnight|noon|midday)"
+DAY_PATTERN = r"(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*|today|tonight|tomorrow"
+# "2am", "at 02:00", "on sunday at 9pm", "9pm tomorrow" (see resolve_time)
+TIME_SPEC_PATTERN = rf"(?:(?:on|at|by|around)\s+)?(?:({DAY_PATTERN})\s*(?:at\s+)?)?({CLOCK_PATTERN})(?:\s+(?:on\s+)?({DAY_PATTERN}))?"
+_RANGE_REGEX = re.compile(rf"({CLOCK_PATTERN}|\d{{1,2}})\s*(?:-|–|—|to|until|till)\s*({CLOCK_PATTERN}|\d{{1,2}})")
+_ALL_DAY_REGEX = re.compile(r"24\s*(?:hours?|hrs?|h)\b|24/7|open 24")
+
+
+# ========== PARSING ==========
+def parse_clock(text: str) -> int:
+    """Minutes after midnight for "7", "7am", "7:30 pm", "19.30", "24:00", "noon"; raises ValueError"""
+    text = text.strip().lower().replace(".m", "m").replace(" ", "")
+    if text in ("noon", "midday"):
+        return 12 * 60
+    if text == "midnight":
+        return 0
+    match = re.fullmatch(r"(\d{1,2})(?:[:.](\d{2}))?([ap]m\.?)?", text)
+    if not match:
+        raise ValueError(f"Not a time: {text!r}")
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Not a time: {text!r}")
+        hour = hour % 12 + (12 if meridiem.startswith("p") else 0)
+    if minute > 59 or hour > 24 or (hour == 24 and minute):
+        raise ValueError(f"Not a time: {text!r}")
+    return hour * 60 + minute
+
+
+def parse_day(text: str) -> int:
+    """Day index (0 = Monday) of a day name or abbreviation ("tue", "Thurs.", "sundays"); raises ValueError"""
+    text = text.strip().lower().rstrip(".")
+    if len(text) >= 3:
+        for index, name in enumerate(DAY_NAMES):
+            if name.startswith(text) or (text.endswith("s") and name.startswith(text[:-1])):
+                return index
+    raise ValueError(f"Not a day: {text!r}")
+
+
+def parse_days(text: str) -> List[int]:
+    """Day indices for "mon-fri", "sat & sun", "weekdays", "daily" ("" means every day)"""
+    text = text.strip().lower().rstrip(":").strip()
+    if text in ("", "daily", "everyday", "every day", "all days", "mon-sun", "monday-sunday"):
+        return list(range(7))
+    if text in ("weekday", "weekdays"):
+        return list(range(5))
+    if text in ("weekend", "weekends"):
+        return [5, 6]
+    days: List[int] = []
+    for part in re.split(r"\s*(?:,|&|\band\b|/)\s*", text):
+        if not part:
+            continue
+        bounds = re.split(r"\s*(?:-|–|—|\bto\b)\s*", part)
+        if len(bounds) == 2:
+            first, last = parse_day(bounds[0]), parse_day(bounds[1])
+            days.extend((first + offset) % 7 for offset in range((last - first) % 7 + 1))
+        elif len(bounds) == 1:
+            days.append(parse_day(bounds[0]))
+        else:
+            raise ValueError(f"Not a day range: {part!r}")
+    return days
+
+
+def parse_day_hours(text: str) -> List[Tuple[int, int]]:
+    """[start, end) minutes within a day for "07:00 - 23:00", "7am-2am" (overnight), "24 hours", "closed"""
+    text = str(text).strip().lower()
+    if not text or text in ("closed", "close", "-"):
+        return []
+    if _ALL_DAY_REGEX.search(text):
+        return [(0, DAY_MINUTES)]
+    ranges = _RANGE_REGEX.findall(text)
+    if not ranges:
+        raise ValueError(f"Not opening hours: {text!r}")
+    intervals = []
+    for opens, closes in ranges:
+        start, end = parse_clock(opens), parse_clock(closes)
+        if end <= start:
+            end += DAY_MINUTES  # Closes after midnight
+        intervals.append((start, end))
+    return intervals
+
+
+def normalize(intervals: Sequence[Tuple[int, int]]) -> Intervals:
+    """Wrap into the week, then sort and merge overlapping or touching intervals"""
+    pieces = []
+    for start, end in intervals:
+        if end - start >= WEEK_MINUTES:
+            return ALL_WEEK
+        start, end = start % WEEK_MINUTES, start % WEEK_MINUTES + (end - start)
+        if end > WEEK_MINUTES:
+            pieces.extend([(start, WEEK_MINUTES), (0, end - WEEK_MINUTES)])
+        elif end > start:
+            pieces.append((start, end))
+    merged: List[List[int]] = []
+    for start, end in sorted(pieces):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return tuple((start, end) for start, end in merged)
+
+
+def _week_intervals(day_hours: Dict[int, List[Tuple[int, int]]]) -> Intervals:
+    return normalize([(day * DAY_MINUTES + start, day * DAY_MINUTES + end)
+                      for day, intervals in day_hours.items() for start, end in intervals])
+
+
+def parse_hours(value: Union[None, str, Dict, List]) -> Optional[Intervals]:
+    """Weekly intervals from scraped hours, or None when they are missing or not understood.
+
+    Accepts "24 Hours", "Mon-Fri 07:00-23:00; Sat-Sun 07:00-02:00" (one
+    "days hours" segment per line or ";"), {"monday": "7am - 11pm", ...} and
+    [{"day": "Monday", "open": "07:00", "close": "23:00"}, ...].
+    """
+    if value is None:
+        return None
+    day_hours: Dict[int, List[Tuple[int, int]]] = {}
+    try:
+        if isinstance(value, dict):
+            for day, hours in value.items():
+                for index in parse_days(str(day)):
+                    day_hours.setdefault(index, []).extend(parse_day_hours(hours))
+        elif isinstance(value, list):
+            for entry in value:
+                hours = entry.get("hours") or f"{entry.get('open') or entry.get('from')} - " \
+                                              f"{entry.get('close') or entry.get('to')}"
+                for index in parse_days(str(entry.get("day", ""))):
+                    day_hours.setdefault(index, []).extend(parse_day_hours(hours))
+        else:
+            text = str(value).strip()
+            if not text or text.upper() in ("N/A", "NA", "-"):
+                return None
+            for segment in re.split(r"\s*(?:;|\n|\|)\s*", text):
+                if not segment:
+                    continue
+                # Days come first: everything before the first digit or hours keyword
+                match = re.match(r"^(.*?)(?=\d|closed|midnight|noon|$)", segment.lower())
+                days = parse_days(match.group(1) if match else "")
+                for index in days:
+                    day_hours.setdefault(index, []).extend(parse_day_hours(segment[len(match.group(1)):]))
+    except (ValueError, AttributeError):
+        return None
+    return _week_intervals(day_hours) if day_hours else None
+
+
+# ========== STORAGE ==========
+def encode_hours(intervals: Optional[Intervals]) -> Optional[str]:
+    """Compact text for the weekly_hours column ("[[420,1380],...]")"""
+    if intervals is None:
+        return None
+    return json.dumps([list(interval) for interval in intervals], separators=(",", ":"))
+
+
+@lru_cache(maxsize=4096)
+def decode_hours(text: Optional[str]) -> Optional[Intervals]:
+    """Intervals from a weekly_hours value (None when unknown); most stores share a few"""
+    if not text:
+        return None
+    try:
+        return tuple((int(start), int(end)) for start, end in json.loads(text))
+    except (ValueError, TypeError):
+        return None
+
+
+def _clock(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def format_hours(intervals: Optional[Intervals]) -> str:
+    """Readable hours: "24 Hours", or "Mon-Fri 07:00-23:00; Sat-Sun 07:00-02:00" """
+    if intervals is None:
+        return "N/A"
+    if intervals == ALL_WEEK:
+        return "24 Hours"
+    spans = [list(interval) for interval in intervals]
+    # An interval over Sunday midnight is stored as two; format it as one
+    if len(spans) > 1 and spans[0][0] == 0 and spans[-1][1] == WEEK_MINUTES:
+        spans[-1][1] = WEEK_MINUTES + spans.pop(0)[1]
+
+    # Cut at each midnight, but keep a short after-midnight tail with the day it started on
+    day_text: List[List[str]] = [[] for _ in DAYS]
+    for start, end in spans:
+        pieces = []
+        while start < end:
+            midnight = (start // DAY_MINUTES + 1) * DAY_MINUTES
+            pieces.append([start, min(end, midnight)])
+            start = midnight
+        if len(pieces) > 1 and pieces[-1][1] % DAY_MINUTES and pieces[-2][0] % DAY_MINUTES:
+            tail = pieces.pop()
+            pieces[-1][1] = tail[1]
+        for start_piece, end_piece in pieces:
+            day = start_piece // DAY_MINUTES % 7
+            end_clock = end_piece - start_piece // DAY_MINUTES * DAY_MINUTES
+            day_text[day].append(f"{_clock(start_piece % DAY_MINUTES)}-"
+                                 f"{_clock(end_clock if end_clock <= DAY_MINUTES else end_clock - DAY_MINUTES)}")
+
+    # Full days stay "00:00-24:00": "24 Hours" means the whole week (is_24h matches on it)
+    texts = [", ".join(sorted(day)) if day else "Closed" for day in day_text]
+    groups = []
+    first = 0
+    for day in range(1, 8):
+        if day == 7 or texts[day] != texts[first]:
+            label = DAYS[first].title() if day - 1 == first else f"{DAYS[first].title()}-{DAYS[day - 1].title()}"
+            groups.append(f"{label} {texts[first]}")
+            first = day
+    return "; ".join(groups)
+
+
+# ========== QUERIES ==========
+def week_minute(when: Optional[datetime] = None) -> int:
+    """Minute of the week of ``when`` (default: now) in outlet local time; naive times are local"""
+    when = datetime.now(TIMEZONE) if when is None else when
+    if when.tzinfo is not None:
+        when = when.astimezone(TIMEZONE)
+    return when.weekday() * DAY_MINUTES + when.hour * 60 + when.minute
+
+
+def is_open(intervals: Optional[Intervals], minute: int) -> Optional[bool]:
+    """Whether a store is open at a minute of the week (None when its hours are unknown)"""
+    if intervals is None:
+        return None
+    index = bisect.bisect_right(intervals, (minute, WEEK_MINUTES)) - 1
+    return index >= 0 and intervals[index][0] <= minute < intervals[index][1]
+
+
+def resolve_time(spec: Union[str, int], now: Optional[datetime] = None) -> int:
+    """Minute of the week for "now", "02:00", "0200", "2am", "sun 21:00" or "tomorrow 9am".
+
+    A time without a day is its next occurrence (the current minute counts).
+    Only an int is taken as a raw minute of the week (for internal callers).
+    Raises ValueError for anything else.
+    """
+    if isinstance(spec, int):
+        if not 0 <= spec < WEEK_MINUTES:
+            raise ValueError(f"Minute of week out of range: {spec}")
+        return spec
+    text = spec.strip().lower()
+    current = week_minute(now)
+    if text.isdigit():
+        # 24-hour HHMM ("0200", "930"), never a minute number
+        if len(text) not in (3, 4) or int(text[:-2]) >= 24 or int(text[-2:]) >= 60:
+            raise ValueError(f"Not a time: {spec!r}")
+        text = f"{text[:-2]}:{text[-2:]}"
+    if text in ("now", "open now", "right now", "currently"):
+        return current
+    match = re.fullmatch(TIME_SPEC_PATTERN, text)
+    if not match:
+        raise ValueError(f"Not a time: {spec!r}")
+    day_word = match.group(1) or match.group(3)
+    clock = parse_clock(match.group(2)) % DAY_MINUTES
+    today = current // DAY_MINUTES
+    if day_word in (None, "today", "tonight"):
+        minute = today * DAY_MINUTES + clock
+        return minute if minute >= current else (minute + DAY_MINUTES) % WEEK_MINUTES
+    day = (today + 1) % 7 if day_word == "tomorrow" else parse_day(day_word)
+    return day * DAY_MINUTES + clock
+
+
+def is_open_at_sql(weekly_hours: Optional[str], when) -> Optional[int]:
+    """SQLite is_open_at(weekly_hours, when): 1/0, or NULL when the hours or the time are unknown"""
+    if weekly_hours is None or when is None:
+        return None
+    try:
+        minute = resolve_time(when if isinstance(when, int) else str(when))
+    except ValueError:
+        return None
+    result = is_open(decode_hours(weekly_hours), minute)
+    return None if result is None else int(result)
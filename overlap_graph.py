@@ -0,0 +1,130 @@
+import math
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from spatial_index import metres_to_chord, to_unit_vector
+from store_cache import DerivedCache, StoreData
+
+DEFAULT_RADIUS_M = 5000  # Catchment radius drawn by the map
+MAX_CACHED_RADII = 8
+RADIUS_STEP_M = 100  # Radii are rounded to this step, so near-identical requests share a graph
+
+
+class OverlapGraph:
+    """Stores whose catchment circles (of ``radius_m``) overlap.
+
+    Points live in a 3-d grid over unit-sphere coordinates whose cell edge is
+    the overlap distance, so each store is only compared with the 27 cells
+    around it instead of every other store. Stores can be added, moved and
+    removed incrementally.
+    """
+
+    def __init__(self, radius_m: float):
+        self.radius_m = radius_m
+        self._chord = metres_to_chord(2 * radius_m)
+        self._limit = self._chord * self._chord
+        self._points: Dict[int, Tuple[float, float, float]] = {}
+        self._coords: Dict[int, Tuple[float, float]] = {}
+        self._cells: Dict[Tuple[int, int, int], Set[int]] = {}
+        self.adjacency: Dict[int, Set[int]] = {}
+
+    def _cell(self, point: Tuple[float, float, float]) -> Tuple[int, int, int]:
+        return tuple(math.floor(axis / self._chord) for axis in point)
+
+    def add(self, store_id: int, lat: float, lng: float):
+        point = to_unit_vector(lat, lng)
+        cx, cy, cz = self._cell(point)
+        neighbours = set()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for other in self._cells.get((cx + dx, cy + dy, cz + dz), ()):
+                        o = self._points[other]
+                        dist = (o[0] - point[0]) ** 2 + (o[1] - point[1]) ** 2 + (o[2] - point[2]) ** 2
+                        if dist <= self._limit:
+                            neighbours.add(other)
+
+        self._points[store_id] = point
+        self._coords[store_id] = (lat, lng)
+        self._cells.setdefault((cx, cy, cz), set()).add(store_id)
+        self.adjacency[store_id] = neighbours
+        for other in neighbours:
+            self.adjacency[other].add(store_id)
+
+    def remove(self, store_id: int):
+        point = self._points.pop(store_id, None)
+        if point is None:
+            return
+        del self._coords[store_id]
+        cell = self._cell(point)
+        self._cells[cell].discard(store_id)
+        if not self._cells[cell]:
+            del self._cells[cell]
+        for other in self.adjacency.pop(store_id):
+            self.adjacency[other].discard(store_id)
+
+    def sync(self, coords: Dict[int, Tuple[float, float]]) -> int:
+        """Bring the graph in line with ``coords``; returns how many stores changed"""
+        changed = 0
+        for store_id in list(self._coords):
+            if coords.get(store_id) != self._coords[store_id]:
+                self.remove(store_id)
+                changed += 1
+        for store_id, (lat, lng) in coords.items():
+            if store_id not in self._coords:
+                self.add(store_id, lat, lng)
+                changed += 1
+        return changed
+
+    def pairs(self) -> List[Tuple[int, int]]:
+        return sorted((a, b) for a, neighbours in self.adjacency.items() for b in neighbours if a < b)
+
+
+# ========== CACHED GRAPHS PER RADIUS ==========
+def _store_coords(data: StoreData) -> Dict[int, Tuple[float, float]]:
+    return {
+        row["id"]: (row["lat"], row["lng"])
+        for row in data.rows
+        if row["lat"] is not None and row["lng"] is not None
+    }
+
+
+def _overlap_builder(radius_m: float):
+    def build(data: StoreData, previous: Optional[Dict]) -> Dict:
+        # Reuse last version's graph so only added/moved/removed stores are touched
+        graph = previous["graph"] if previous else OverlapGraph(radius_m)
+        graph.sync(_store_coords(data))
+        names = {row["id"]: row["name"] for row in data.rows}
+        return {
+            "graph": graph,
+            "response": {
+                "radius": radius_m,
+                "intersected": sorted(names[i] for i, n in graph.adjacency.items() if n),
+                "adjacency": {i: sorted(n) for i, n in graph.adjacency.items() if n},
+                "pairs": graph.pairs(),
+            },
+        }
+    return build
+
+
+_graphs_lock = threading.Lock()
+_graphs: Dict[int, DerivedCache] = {}
+
+
+def cache_radius(radius_m: float) -> int:
+    """``radius_m`` rounded to RADIUS_STEP_M (at least one step), the key graphs are cached under"""
+    return max(RADIUS_STEP_M, int(round(radius_m / RADIUS_STEP_M)) * RADIUS_STEP_M)
+
+
+def get_overlaps(radius_m: float = DEFAULT_RADIUS_M) -> Dict:
+    """Overlap graph for ``radius_m`` (rounded by cache_radius), recomputed only when the store data changes"""
+    radius_m = cache_radius(radius_m)
+    with _graphs_lock:
+        cache = _graphs.get(radius_m)
+        if cache is None:
+            if len(_graphs) >= MAX_CACHED_RADII:
+                # Drop the oldest radius, but keep the map's default graph warm
+                oldest = next(radius for radius in _graphs if radius != DEFAULT_RADIUS_M)
+                del _graphs[oldest]
+            cache = _graphs[radius_m] = DerivedCache(_overlap_builder(radius_m))
+    return cache.get()["response"]
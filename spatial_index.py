@@ -0,0 +1,169 @@
+import heapq
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from store_cache import DerivedCache, StoreData, row_feature_mask
+
+EARTH_RADIUS_M = 6371000.0
+LEAF_SIZE = 16
+
+
+# ========== GEOMETRY HELPERS ==========
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in metres between two points"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def to_unit_vector(lat: float, lng: float) -> Tuple[float, float, float]:
+    """Project lat/lng onto the unit sphere; chord length is monotonic in distance"""
+    phi, lam = math.radians(lat), math.radians(lng)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def metres_to_chord(metres: float) -> float:
+    """Chord length on the unit sphere for a great-circle distance"""
+    return 2 * math.sin(min(metres / EARTH_RADIUS_M, math.pi) / 2)
+
+
+def chord_to_metres(chord: float) -> float:
+    """Great-circle distance for a chord length on the unit sphere"""
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, chord / 2))
+
+
+# ========== KD-TREE ==========
+class KDTree:
+    """Static 3-d tree over unit vectors with optional per-point bitmask filtering.
+
+    Works on the sphere directly, so it needs no tuning for latitude or data
+    density: radius and k-nearest queries are O(log n + results).
+    """
+
+    def __init__(self, points: Sequence[Tuple[float, float, float]], masks: Sequence[int]):
+        self._points = list(points)
+        self._masks = list(masks)
+        self._order = list(range(len(self._points)))
+        self._root = self._build(0, len(self._order)) if self._order else None
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _build(self, start: int, end: int):
+        if end - start <= LEAF_SIZE:
+            return (None, start, end)
+
+        points = self._points
+        segment = self._order[start:end]
+        spreads = [
+            max(points[i][axis] for i in segment) - min(points[i][axis] for i in segment)
+            for axis in range(3)
+        ]
+        axis = spreads.index(max(spreads))
+        segment.sort(key=lambda i: points[i][axis])
+        self._order[start:end] = segment
+
+        mid = (start + end) // 2
+        split = points[self._order[mid]][axis]
+        return (axis, split, self._build(start, mid), self._build(mid, end))
+
+    def within(self, query: Tuple[float, float, float], chord: float, required: int = 0) -> List[Tuple[float, int]]:
+        """All points within ``chord`` of ``query`` as (squared chord, index) pairs"""
+        found: List[Tuple[float, int]] = []
+        limit = chord * chord
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            if node[0] is None:
+                for i in self._order[node[1]:node[2]]:
+                    if self._masks[i] & required != required:
+                        continue
+                    dist = _squared_distance(self._points[i], query)
+                    if dist <= limit:
+                        found.append((dist, i))
+                continue
+
+            axis, split, left, right = node
+            delta = query[axis] - split
+            if delta - chord <= 0:
+                stack.append(left)
+            if delta + chord >= 0:
+                stack.append(right)
+        found.sort()
+        return found
+
+    def nearest(self, query: Tuple[float, float, float], k: int, chord: float = 2.0,
+                required: int = 0) -> List[Tuple[float, int]]:
+        """Up to ``k`` nearest points within ``chord`` as (squared chord, index) pairs"""
+        heap: List[Tuple[float, int]] = []  # max-heap of (-dist, index)
+        limit = chord * chord
+
+        def visit(node):
+            nonlocal limit
+            if node[0] is None:
+                for i in self._order[node[1]:node[2]]:
+                    if self._masks[i] & required != required:
+                        continue
+                    dist = _squared_distance(self._points[i], query)
+                    if dist > limit:
+                        continue
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-dist, i))
+                    else:
+                        heapq.heapreplace(heap, (-dist, i))
+                    if len(heap) == k:
+                        limit = -heap[0][0]
+                return
+
+            axis, split, left, right = node
+            delta = query[axis] - split
+            near, far = (left, right) if delta < 0 else (right, left)
+            visit(near)
+            if delta * delta <= limit:
+                visit(far)
+
+        if self._root and k > 0:
+            visit(self._root)
+        return sorted((-neg, i) for neg, i in heap)
+
+
+def _squared_distance(a: Tuple[float, float, float], b: Tuple[float, float, float]) -> float:
+    dx, dy, dz = a[0] - b[0], a[1] - b[1], a[2] - b[2]
+    return dx * dx + dy * dy + dz * dz
+
+
+# ========== STORE INDEX ==========
+class StoreIndex:
+    """KD-tree over every store that has coordinates"""
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = [row for row in rows if row["lat"] is not None and row["lng"] is not None]
+        self.tree = KDTree(
+            [to_unit_vector(row["lat"], row["lng"]) for row in self.rows],
+            [row_feature_mask(row) for row in self.rows],
+        )
+
+    def nearby(self, lat: float, lng: float, radius_m: Optional[float] = None,
+               k: Optional[int] = None, required: int = 0) -> List[Tuple[float, Dict]]:
+        """Stores near a point as (distance in metres, row), closest first.
+
+        With ``k`` the result is the k nearest (optionally capped by
+        ``radius_m``); without it, every store within ``radius_m``.
+        """
+        query = to_unit_vector(lat, lng)
+        chord = metres_to_chord(radius_m) if radius_m is not None else 2.0
+        if k is None:
+            hits = self.tree.within(query, chord, required)
+        else:
+            hits = self.tree.nearest(query, k, chord, required)
+        return [(chord_to_metres(math.sqrt(dist)), self.rows[i]) for dist, i in hits]
+
+
+def _build_store_index(data: StoreData, previous) -> StoreIndex:
+    return StoreIndex(data.rows)
+
+
+store_index = DerivedCache(_build_store_index)
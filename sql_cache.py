@@ -0,0 +1,191 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+# Kept apart from the stores DB so cache writes don't invalidate store snapshots
+CACHE_DB_NAME = os.getenv("CHATBOT_CACHE_DB", "chatbot_cache.db")
+MEMORY_SIZE = 1024
+DISK_SIZE = 100000
+TTL = 7 * 24 * 3600  # Store data changes rarely; re-ask the LLM weekly
+
+# Abbreviations and spellings rewritten before keying
+ABBREVIATIONS = [
+    (r"\bkl\b", "kuala lumpur"),
+    (r"\bpj\b", "petaling jaya"),
+    (r"\bmcd(?:onald'?s?)?\b", "mcdonalds"),
+    (r"\b24\s*-?\s*(?:hours?|hrs?|h)\b", "24hours"),
+    (r"\bwi-?fi\b", "wifi"),
+    (r"\bmc\s*cafe\b", "mccafe"),
+    (r"\bmc\s*delivery\b", "mcdelivery"),
+    (r"\bbirthday part(?:y|ies)\b", "birthday_party"),
+    (r"\bdessert cent(?:er|re)s?\b", "dessert_center"),
+    (r"\b(?:digital )?(?:order )?kiosks?\b", "digital_kiosk"),
+    (r"\bcashless(?: facility)?\b", "cashless"),
+]
+
+# Terms whose order in the question doesn't change its meaning
+FEATURE_TERMS = {
+    "24hours", "wifi", "mccafe", "mcdelivery", "birthday_party", "breakfast",
+    "dessert_center", "digital_kiosk", "cashless",
+}
+NEGATIONS = {"without", "no", "not"}
+DISJUNCTIONS = {"or"}
+FILLER_WORDS = {"and", "with", "&", "plus", "also"}
+
+
+def canonicalize_query(query: str) -> str:
+    """Cache key for a question: "McCafe and breakfast in KL?" == "kl breakfast & mccafe".
+
+    Lowercases, expands abbreviations, strips punctuation and filler words,
+    and moves feature terms (negated ones prefixed with "-") to a sorted tail.
+    The tail keeps the and/or grouping: features joined by "or" form one
+    "|"-separated clause, and clauses are ANDed ("wifi or mccafe and
+    breakfast" -> "breakfast mccafe|wifi").
+    """
+    text = query.lower().strip()
+    for pattern, replacement in ABBREVIATIONS:
+        text = re.sub(pattern, replacement, text)
+    tokens = re.findall(r"[a-z0-9_&]+", text)
+
+    words: List[str] = []
+    clauses: List[Set[str]] = []
+    negate = False
+    join_or = False
+    for token in tokens:
+        if token in NEGATIONS:
+            negate = True
+            continue
+        if token in DISJUNCTIONS:
+            join_or = True
+            continue
+        if token in FEATURE_TERMS:
+            feature = ("-" if negate else "") + token
+            if join_or and clauses:
+                clauses[-1].add(feature)
+            else:
+                clauses.append({feature})
+            negate = join_or = False
+            continue
+        if join_or:
+            words.append("or")  # "or" between non-feature words: keep it in place
+            join_or = False
+        if negate:
+            words.append("not")  # Negation of a non-feature word: keep it in place
+            negate = False
+        if token not in FILLER_WORDS:
+            words.append(token)
+    return " ".join(words + sorted("|".join(sorted(clause)) for clause in clauses))
+
+
+class SQLCache:
+    """Two-tier (in-process LRU + SQLite) cache of generated SQL with TTL"""
+
+    def __init__(self, db_path: str = CACHE_DB_NAME, memory_size: int = MEMORY_SIZE,
+                 disk_size: int = DISK_SIZE, ttl: float = TTL):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (sql, expires_at)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    query_key TEXT PRIMARY KEY,
+                    sql TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sql_cache_last_used ON sql_cache(last_used)")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def _remember(self, key: str, sql: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (sql, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+            if entry:
+                del self._memory[key]
+
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT sql, expires_at FROM sql_cache WHERE query_key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE sql_cache SET last_used = ? WHERE query_key = ?", (now, key))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"SQL cache read failed: {e}")
+            row = None
+
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("disk_hits")
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key: str, sql: str):
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, sql, expires_at)
+        self._count("stores")
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO sql_cache (query_key, sql, created_at, expires_at, last_used)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (key, sql, now, expires_at, now))
+                # Size bound: drop expired rows, then the least recently used overflow
+                conn.execute("DELETE FROM sql_cache WHERE expires_at <= ?", (now,))
+                overflow = conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0] - self.disk_size
+                if overflow > 0:
+                    conn.execute('''
+                        DELETE FROM sql_cache WHERE query_key IN (
+                            SELECT query_key FROM sql_cache ORDER BY last_used LIMIT ?
+                        )
+                    ''', (overflow,))
+                    self._count("evictions", overflow)
+        except sqlite3.Error as e:
+            print(f"SQL cache write failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.counters, memory_entries=len(self._memory))
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+sql_cache = SQLCache()
@@ -0,0 +1,231 @@
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple, Union
+
+from db import DB_NAME, connect_reader
+
+# Tables generated SQL may read
+ALLOWED_TABLES = {"stores", "stores_fts"}
+# FTS5 reads its shadow tables through the same authorizer
+ALLOWED_TABLES |= {f"stores_fts_{shadow}" for shadow in ("data", "idx", "config", "docsize")}
+# Read-only pragmas FTS5 runs internally
+ALLOWED_PRAGMAS = {"data_version"}
+# Functions that touch the filesystem or extensions, or allocate huge values in one
+# call (which never yields to the progress handler), are never allowed
+DENIED_FUNCTIONS = {"load_extension", "readfile", "writefile", "edit", "fts3_tokenizer",
+                    "randomblob", "zeroblob", "printf", "format"}
+MAX_VALUE_LENGTH = 1_000_000  # Bytes in any string or blob a query may build
+
+MAX_ROWS = 1000  # Automatic LIMIT on every generated query
+VM_BUDGET = 5_000_000  # SQLite VM instructions per query
+QUERY_TIMEOUT = 0.25  # Wall-clock seconds per query
+PROGRESS_INTERVAL = 1000  # Instructions between progress handler calls
+STATEMENT_CACHE_SIZE = 256
+
+
+class QueryRejected(Exception):
+    """Generated SQL is not a single read-only query over the allowed tables"""
+
+
+class QueryAborted(Exception):
+    """A query ran past its instruction budget or deadline"""
+
+
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+
+
+def _authorizer(action, arg1, arg2, db_name, trigger):
+    """Allow reads of ALLOWED_TABLES and plain functions; deny everything else"""
+    if action == sqlite3.SQLITE_PRAGMA and arg1 in ALLOWED_PRAGMAS and arg2 is None:
+        return sqlite3.SQLITE_OK
+    if arg1 == "sqlite_master" and (action == sqlite3.SQLITE_UPDATE or (action == sqlite3.SQLITE_READ and arg2 == "ROWID")):
+        # What FTS5 checks when it first opens stores_fts (the connection is read-only anyway);
+        # a statement reading the schema's columns is still denied
+        return sqlite3.SQLITE_OK
+    if action not in _ALLOWED_ACTIONS:
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_READ and arg1 not in ALLOWED_TABLES:
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_FUNCTION and arg2 and arg2.lower() in DENIED_FUNCTIONS:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+class _Budget:
+    """Progress handler state: aborts the running statement once over budget"""
+
+    def __init__(self):
+        self.steps_left = 0
+        self.deadline = 0.0
+        self.aborted = False
+
+    def arm(self, instructions: int, timeout: float):
+        self.steps_left = instructions // PROGRESS_INTERVAL
+        self.deadline = time.monotonic() + timeout
+        self.aborted = False
+
+    def __call__(self) -> int:
+        self.steps_left -= 1
+        if self.steps_left < 0 or time.monotonic() > self.deadline:
+            self.aborted = True
+            return 1  # Non-zero interrupts the statement
+        return 0
+
+
+def connect(db_path: str = DB_NAME, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Read-only connection with the allowlist authorizer attached.
+
+    Not taken from the shared pool: the authorizer would also restrict
+    the app's own queries on that connection.
+    """
+    conn = connect_reader(db_path, check_same_thread, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, MAX_VALUE_LENGTH)
+    conn.row_factory = sqlite3.Row
+    conn.set_authorizer(_authorizer)
+    return conn
+
+
+def _arm(conn: sqlite3.Connection, instructions: int, timeout: float) -> "_Budget":
+    budget = _Budget()
+    budget.arm(instructions, timeout)
+    conn.set_progress_handler(budget, PROGRESS_INTERVAL)
+    return budget
+
+
+_normalized: Dict[str, str] = {}
+_normalized_lock = threading.Lock()
+
+
+def normalize_sql(sql_query: str, max_rows: int = MAX_ROWS) -> str:
+    """Canonical, row-capped form of a SELECT.
+
+    Whitespace is collapsed and trailing semicolons dropped, so equivalent
+    LLM outputs share one prepared statement in the connection's cache.
+    """
+    key = f"{max_rows}:{sql_query}"
+    cached = _normalized.get(key)
+    if cached:
+        return cached
+
+    sql = re.sub(r"\s+", " ", sql_query).strip().rstrip(";").strip()
+    if not re.match(r"(?i)(select|with)\b", sql):
+        raise QueryRejected("Only SELECT queries are allowed")
+
+    # The inner query keeps its own LIMIT/ORDER BY; the outer one caps the rows.
+    # A smuggled second statement becomes a syntax error inside the parentheses.
+    normalized = f"SELECT * FROM ({sql}) LIMIT {int(max_rows)}"
+    with _normalized_lock:
+        if len(_normalized) >= STATEMENT_CACHE_SIZE * 4:
+            _normalized.clear()
+        _normalized[key] = normalized
+    return normalized
+
+
+class SQLSandbox:
+    """Runs generated SQL on per-thread read-only connections under a budget"""
+
+    def __init__(self, db_path: str = DB_NAME, max_rows: int = MAX_ROWS,
+                 vm_budget: int = VM_BUDGET, timeout: float = QUERY_TIMEOUT):
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.vm_budget = vm_budget
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {"queries": 0, "rejected": 0, "aborted": 0, "errors": 0}
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def _prepare(self, sql_query: str) -> str:
+        try:
+            return normalize_sql(sql_query, self.max_rows)
+        except QueryRejected:
+            self._count("rejected")
+            raise
+
+    def _failed(self, budget: _Budget, error: sqlite3.Error):
+        if budget.aborted:
+            self._count("aborted")
+            return QueryAborted("Query exceeded its time budget")
+        if "not authorized" in str(error) or "prohibited" in str(error):
+            self._count("rejected")
+            return QueryRejected(str(error))
+        self._count("errors")
+        return error
+
+    def run(self, sql_query: str, params: Tuple = ()) -> List[Dict]:
+        """Execute a generated SELECT; raises QueryRejected, QueryAborted or sqlite3.Error"""
+        sql = self._prepare(sql_query)
+        conn = self._connection()
+        budget = _arm(conn, self.vm_budget, self.timeout)
+        self._count("queries")
+        try:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        except sqlite3.Error as e:
+            raise self._failed(budget, e) from e
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def run_many(self, queries: List[Tuple[str, Tuple]]) -> List[Union[List[Dict], Exception]]:
+        """Run several (sql, params) in one read transaction, so all see the same snapshot.
+
+        Each query keeps its own budget; a failed query's slot holds its exception.
+        """
+        conn = self._connection()
+        results: List[Union[List[Dict], Exception]] = []
+        # BEGIN is not on the allowlist, so it runs with the authorizer detached
+        conn.set_authorizer(None)
+        conn.execute("BEGIN")
+        conn.set_authorizer(_authorizer)
+        try:
+            for sql_query, params in queries:
+                try:
+                    results.append(self.run(sql_query, params))
+                except (QueryRejected, QueryAborted, sqlite3.Error) as e:
+                    results.append(e)
+        finally:
+            conn.set_authorizer(None)
+            conn.rollback()  # Read-only: just ends the transaction
+            conn.set_authorizer(_authorizer)
+        return results
+
+    def iter_chunks(self, sql_query: str, params: Tuple = (), chunk_size: int = 50) -> Iterator[List[Dict]]:
+        """Like run(), yielding rows in chunks; the budget covers time spent in SQLite only"""
+        sql = self._prepare(sql_query)
+        # Consumed from threadpool workers, one chunk per hop
+        conn = connect(self.db_path, check_same_thread=False)
+        budget = _arm(conn, self.vm_budget, self.timeout)
+        self._count("queries")
+        try:
+            try:
+                cursor = conn.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    paused = time.monotonic()
+                    yield [dict(row) for row in rows]
+                    # Time the consumer holds the generator doesn't count
+                    budget.deadline += time.monotonic() - paused
+            except sqlite3.Error as e:
+                raise self._failed(budget, e) from e
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+sql_sandbox = SQLSandbox()
@@ -0,0 +1,124 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from db import DB_NAME, reader
+
+# API feature name -> stores column
+FEATURE_COLUMNS = {
+    "birthday_party": "has_birthday_party",
+    "breakfast": "has_breakfast",
+    "cashless": "has_cashless",
+    "dessert_center": "has_dessert_center",
+    "digital_kiosk": "has_digital_kiosk",
+    "mccafe": "has_mccafe",
+    "wifi": "has_wifi",
+    "mcdelivery": "has_mcdelivery",
+}
+
+# One bit per feature, plus a derived bit for 24-hour outlets
+FEATURE_BITS = {name: 1 << i for i, name in enumerate(list(FEATURE_COLUMNS) + ["24_hours"])}
+
+STORE_COLUMNS = [
+    "id", "name", "address", "lat", "lng", "operating_hours", "waze_link",
+    "telephone", "email",
+] + list(FEATURE_COLUMNS.values()) + ["weekly_hours"]
+
+
+def data_version(db_path: str = DB_NAME) -> Tuple:
+    """Cheap fingerprint of the database files; changes whenever a writer commits"""
+    version = []
+    for suffix in ("", "-wal"):
+        try:
+            stat = os.stat(db_path + suffix)
+        except FileNotFoundError:
+            version.append(None)
+            continue
+        version.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+def parse_coordinate(value: Any) -> Optional[float]:
+    """Convert a stored lat/lng ("3.14", 3.14, "N/A", None) to a float or None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def feature_mask(names: List[str]) -> int:
+    """Combine feature names into a bitmask; raises KeyError on unknown names"""
+    mask = 0
+    for name in names:
+        mask |= FEATURE_BITS[name]
+    return mask
+
+
+def row_feature_mask(row: Dict) -> int:
+    """Bitmask of the features a store row offers"""
+    mask = 0
+    for name, column in FEATURE_COLUMNS.items():
+        if row.get(column):
+            mask |= FEATURE_BITS[name]
+    if "24 Hours" in str(row.get("operating_hours") or ""):
+        mask |= FEATURE_BITS["24_hours"]
+    return mask
+
+
+def load_stores(db_path: str = DB_NAME) -> List[Dict]:
+    """Read every store row, with coordinates parsed to floats (None if missing)"""
+    cursor = reader(db_path).execute(f"SELECT {', '.join(STORE_COLUMNS)} FROM stores ORDER BY id")
+    rows = [dict(row) for row in cursor.fetchall()]
+
+    for row in rows:
+        row["lat"] = parse_coordinate(row["lat"])
+        row["lng"] = parse_coordinate(row["lng"])
+    return rows
+
+
+class StoreData(NamedTuple):
+    version: Tuple
+    rows: List[Dict]
+
+
+_stores_lock = threading.Lock()
+_stores: Dict[str, StoreData] = {}
+
+
+def current_stores(db_path: str = DB_NAME) -> StoreData:
+    """Return the cached store rows, reloading them only if the database changed"""
+    version = data_version(db_path)
+    data = _stores.get(db_path)
+    if data is not None and data.version == version:
+        return data
+
+    with _stores_lock:
+        data = _stores.get(db_path)
+        if data is None or data.version != version:
+            data = StoreData(version, load_stores(db_path))
+            _stores[db_path] = data
+        return data
+
+
+class DerivedCache:
+    """A value computed from the store rows, rebuilt once per data version.
+
+    ``build(data, previous)`` receives the new StoreData and the previously
+    built value (None on first use) so builders can update incrementally.
+    """
+
+    def __init__(self, build: Callable[[StoreData, Any], Any], db_path: str = DB_NAME):
+        self._build = build
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        self._source: Optional[StoreData] = None
+        self._value: Any = None
+
+    def get(self) -> Any:
+        data = current_stores(self._db_path)
+        if data is not self._source:
+            with self._lock:
+                if data is not self._source:
+                    self._value = self._build(data, self._value)
+                    self._source = data
+        return self._value
@@ -0,0 +1,48 @@
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+
+class Snapshot:
+    """Immutable, pre-encoded JSON payload with its gzip form and strong ETags"""
+
+    __slots__ = ("body", "gzip_body", "etag", "gzip_etag")
+
+    def __init__(self, payload: Any):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        # Each representation gets its own strong validator
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'
+
+
+def _etag_matches(if_none_match: Optional[str], snapshot: Snapshot) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    tags |= {tag[2:] for tag in tags if tag.startswith("W/")}  # Weak comparison per RFC 9110
+    return "*" in tags or snapshot.etag in tags or snapshot.gzip_etag in tags
+
+
+def snapshot_response(request: Request, snapshot: Snapshot,
+                      headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serve a snapshot, honouring If-None-Match and Accept-Encoding: gzip"""
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    response_headers = {
+        "ETag": snapshot.gzip_etag if use_gzip else snapshot.etag,
+        "Cache-Control": "no-cache",  # Always revalidate; 304s are cheap
+        "Vary": "Accept-Encoding",
+        **(headers or {}),
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), snapshot):
+        return Response(status_code=304, headers=response_headers)
+
+    if use_gzip:
+        response_headers["Content-Encoding"] = "gzip"
+        return Response(snapshot.gzip_body, media_type="application/json", headers=response_headers)
+    return Response(snapshot.body, media_type="application/json", headers=response_headers)
@@ -0,0 +1,252 @@
+import re
+import sys
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from location_search import PREFIX_MIN_LENGTH, area_tokens
+from opening_hours import decode_hours
+from spatial_index import EARTH_RADIUS_M
+from store_cache import FEATURE_BITS, FEATURE_COLUMNS, DerivedCache, StoreData
+
+# Feature matrix columns, in FEATURE_BITS order (bit i is column i)
+FEATURE_NAMES = list(FEATURE_BITS)
+# stores/intent column -> feature name ("is_24h" is the derived 24-hour column)
+COLUMN_FEATURES = {**{column: name for name, column in FEATURE_COLUMNS.items()}, "is_24h": "24_hours"}
+
+# Low-cardinality text columns stored as codes into a shared category list
+CATEGORICAL_COLUMNS = ["operating_hours"]
+
+
+def _search_text(*parts: Optional[str]) -> str:
+    """Space-delimited lowercase word tokens, the way stores_fts tokenizes them.
+
+    Columns are separated by "|" so a phrase can't match across two of them.
+    """
+    columns = [" ".join(re.findall(r"[^\W_]+", (part or "").lower())) for part in parts]
+    return " " + " | ".join(columns) + " "
+
+
+def _postings(texts: List[str]) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """(sorted vocabulary, token -> ascending positions of the texts containing it)"""
+    positions: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        for token in set(text.split()):
+            positions.setdefault(token, []).append(i)
+    positions.pop("|", None)  # Column separator, not a word
+    return sorted(positions), {token: np.array(found, dtype=np.int64) for token, found in positions.items()}
+
+
+# ========== TABLE ==========
+class StoreTable:
+    """Columnar copy of the stores table for vectorised filtering.
+
+    Coordinates are float64 arrays (NaN when missing), features a boolean
+    (stores x FEATURE_NAMES) matrix plus packed bitmasks, and text columns are
+    interned. Every query returns a boolean mask or index array over all
+    stores; ``records`` turns indices back into the cached row dicts.
+    """
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        n = len(rows)
+        self.ids = np.fromiter((row["id"] for row in rows), dtype=np.int64, count=n)
+        self.lat = np.array([np.nan if row["lat"] is None else row["lat"] for row in rows], dtype=np.float64)
+        self.lng = np.array([np.nan if row["lng"] is None else row["lng"] for row in rows], dtype=np.float64)
+        self.has_coordinates = ~(np.isnan(self.lat) | np.isnan(self.lng))
+        # Latitude-sorted positions of located stores, so a bbox only scans its latitude band
+        located = np.flatnonzero(self.has_coordinates)
+        self._lat_order = located[np.argsort(self.lat[located], kind="stable")]
+        self._sorted_lat = self.lat[self._lat_order]
+
+        self.features = np.zeros((n, len(FEATURE_NAMES)), dtype=bool)
+        for name, column in FEATURE_COLUMNS.items():
+            self.features[:, FEATURE_NAMES.index(name)] = [bool(row[column]) for row in rows]
+        self.features[:, FEATURE_NAMES.index("24_hours")] = [
+            "24 Hours" in str(row["operating_hours"] or "") for row in rows
+        ]
+        self.masks = self.features.astype(np.int64) @ (1 << np.arange(len(FEATURE_NAMES), dtype=np.int64))
+
+        self.names = [sys.intern(row["name"] or "") for row in rows]
+        self.addresses = [sys.intern(row["address"] or "") for row in rows]
+        self.categories: Dict[str, List[str]] = {}
+        self.codes: Dict[str, np.ndarray] = {}
+        for column in CATEGORICAL_COLUMNS:
+            values = [sys.intern(str(row[column] or "")) for row in rows]
+            categories, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+            self.categories[column] = [sys.intern(value) for value in categories.tolist()]
+            self.codes[column] = codes.astype(np.int32)
+
+        # Opening hours as one flat list of [start, end) week-minute intervals and their owning stores
+        weekly = [decode_hours(row.get("weekly_hours")) for row in rows]
+        owners = [i for i, hours in enumerate(weekly) for _ in (hours or ())]
+        bounds = np.array([interval for hours in weekly for interval in (hours or ())], dtype=np.int32).reshape(-1, 2)
+        self._hours_owner = np.array(owners, dtype=np.int64)
+        self._hours_start, self._hours_end = bounds[:, 0], bounds[:, 1]
+
+        # Word-token text for location/name phrases (same terms as stores_fts), indexed by token
+        self._name_text = [_search_text(name) for name in self.names]
+        self._all_text = [
+            _search_text(name, address, area_tokens(address)) for name, address in zip(self.names, self.addresses)
+        ]
+        self._name_index = _postings(self._name_text)
+        self._all_index = _postings(self._all_text)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    # ---------- masks ----------
+    def feature_mask(self, required: int = 0, excluded: int = 0) -> np.ndarray:
+        """Stores offering every feature bit in ``required`` and none in ``excluded``"""
+        return ((self.masks & required) == required) & ((self.masks & excluded) == 0)
+
+    def clause_mask(self, clauses: Sequence[Sequence[Tuple[str, bool]]]) -> np.ndarray:
+        """AND of ORs of (column, wanted) constraints, as produced by intent_parser"""
+        mask = np.ones(len(self), dtype=bool)
+        for clause in clauses:
+            any_of = np.zeros(len(self), dtype=bool)
+            for column, wanted in clause:
+                has = self.features[:, FEATURE_NAMES.index(COLUMN_FEATURES[column])]
+                any_of |= has if wanted else ~has
+            mask &= any_of
+        return mask
+
+    def bbox_mask(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Stores inside a lat/lng box; west > east means the box crosses the antimeridian"""
+        # NaN compares False, so stores without coordinates drop out
+        in_lat = (self.lat >= south) & (self.lat <= north)
+        if west <= east:
+            return in_lat & (self.lng >= west) & (self.lng <= east)
+        return in_lat & ((self.lng >= west) | (self.lng <= east))
+
+    def bbox_indices(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Like bbox_mask, as ascending indices; cost follows the latitude band, not the table"""
+        start = np.searchsorted(self._sorted_lat, south, side="left")
+        end = np.searchsorted(self._sorted_lat, north, side="right")
+        band = self._lat_order[start:end]
+        lng = self.lng[band]
+        inside = (lng >= west) & (lng <= east) if west <= east else (lng >= west) | (lng <= east)
+        return np.sort(band[inside])
+
+    def text_indices(self, phrase: str, names_only: bool = False) -> np.ndarray:
+        """Ascending indices of stores whose name (or name/address/area) contains ``phrase``.
+
+        Same rules as location_search.fts_match: the words appear in order and
+        the last may be a prefix unless it is short or a full postcode.
+        Candidates come from the token index; only multi-word phrases are
+        checked against the text, and only for those candidates.
+        """
+        words = re.findall(r"[^\W_]+", phrase.lower())
+        if not words:
+            return np.arange(len(self))
+        last = words[-1]
+        prefix = len(last) >= PREFIX_MIN_LENGTH if not last.isdigit() else len(last) < 5
+        vocabulary, postings = self._name_index if names_only else self._all_index
+
+        if prefix:
+            start = bisect_left(vocabulary, last)
+            end = bisect_left(vocabulary, last[:-1] + chr(ord(last[-1]) + 1))
+            found = [postings[token] for token in vocabulary[start:end]]
+            indices = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+        else:
+            indices = postings.get(last, np.empty(0, dtype=np.int64))
+        for word in words[:-1]:
+            indices = np.intersect1d(indices, postings.get(word, np.empty(0, dtype=np.int64)), assume_unique=True)
+        if len(words) == 1 or not len(indices):
+            return indices
+
+        pattern = re.compile(" " + re.escape(" ".join(words)) + ("" if prefix else " "))
+        texts = self._name_text if names_only else self._all_text
+        return indices[[pattern.search(texts[i]) is not None for i in indices.tolist()]]
+
+    def text_mask(self, phrase: str, names_only: bool = False) -> np.ndarray:
+        """text_indices as a boolean mask over all stores"""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.text_indices(phrase, names_only)] = True
+        return mask
+
+    def open_mask(self, minute: int) -> np.ndarray:
+        """Stores open at a minute of the week (see opening_hours.resolve_time); unknown hours are excluded"""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self._hours_owner[(self._hours_start <= minute) & (self._hours_end > minute)]] = True
+        return mask
+
+    def distances_m(self, lat: float, lng: float) -> np.ndarray:
+        """Haversine distance in metres from a point to every store (NaN without coordinates)"""
+        phi1, phi2 = np.radians(lat), np.radians(self.lat)
+        d_phi = phi2 - phi1
+        d_lambda = np.radians(self.lng - lng)
+        a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+    def within_mask(self, lat: float, lng: float, radius_m: float) -> np.ndarray:
+        return self.distances_m(lat, lng) <= radius_m
+
+    # ---------- results ----------
+    def nearest(self, lat: float, lng: float, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, distances) of the ``k`` nearest stores passing ``mask``, closest first"""
+        distances = self.distances_m(lat, lng)
+        candidates = np.flatnonzero(self.has_coordinates if mask is None else mask & self.has_coordinates)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(distances[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(distances[candidates], kind="stable")]
+        return order, distances[order]
+
+    def category(self, column: str, index: int) -> str:
+        return self.categories[column][self.codes[column][index]]
+
+    def records(self, selection, limit: Optional[int] = None) -> List[Dict]:
+        """Row dicts for a boolean mask or index array (in table order for masks)"""
+        indices = np.flatnonzero(selection) if selection.dtype == bool else selection
+        if limit is not None:
+            indices = indices[:limit]
+        return [self.rows[i] for i in indices.tolist()]
+
+    def select(self, bbox: Optional[Tuple[float, float, float, float]] = None, required: int = 0,
+               open_at: Optional[int] = None) -> np.ndarray:
+        """Ascending indices of stores inside ``bbox`` (if given) offering the ``required`` features
+        and open at minute-of-week ``open_at`` (if given)"""
+        indices = self.bbox_indices(*bbox) if bbox is not None else np.arange(len(self))
+        if required:
+            indices = indices[(self.masks[indices] & required) == required]
+        if open_at is not None:
+            indices = indices[self.open_mask(open_at)[indices]]
+        return indices
+
+    def page(self, indices: np.ndarray, after_id: Optional[int], limit: Optional[int]) -> Tuple[List[Dict], Optional[int]]:
+        """(rows, next cursor) for ascending ``indices``, keyset-paginated by store id"""
+        if after_id is not None:
+            indices = indices[np.searchsorted(self.ids[indices], after_id, side="right"):]
+        if limit is None or len(indices) <= limit:
+            return self.records(indices), None
+        indices = indices[:limit]
+        return self.records(indices), int(self.ids[indices[-1]])
+
+
+def _build_store_table(data: StoreData, previous) -> StoreTable:
+    return StoreTable(data.rows)
+
+
+store_table = DerivedCache(_build_store_table)
+
+
+def match_intent(clauses, locations: List[List[str]], names: List[str], limit: Optional[int] = None,
+                 open_at: Optional[int] = None, excluded_locations: Sequence[str] = ()) -> List[Dict]:
+    """Stores matching a parsed intent, answered from memory instead of SQLite.
+
+    ``locations`` is an AND of ORs of phrases, as produced by intent_parser.
+    """
+    table = store_table.get()
+    mask = table.clause_mask(clauses)
+    if open_at is not None:
+        mask &= table.open_mask(open_at)
+    for location in excluded_locations:
+        mask[table.text_indices(location)] = False
+
+    # Phrases narrow the stores through the token index; the masks then filter only those
+    indices = None
+    for phrases, names_only in [(alternatives, False) for alternatives in locations] + [([name], True) for name in names]:
+        found = np.unique(np.concatenate([table.text_indices(phrase, names_only) for phrase in phrases]))
+        indices = found if indices is None else np.intersect1d(indices, found, assume_unique=True)
+    return table.records(mask if indices is None else indices[mask[indices]], limit)
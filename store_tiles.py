@@ -0,0 +1,158 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+from store_cache import DerivedCache, StoreData
+from store_table import store_table
+
+TILE_SIZE = 256  # Web Mercator tile edge in pixels
+CELL_SIZE = 64  # Cluster grid cell edge in pixels (4 x 4 cells per tile)
+CELLS_PER_TILE = TILE_SIZE // CELL_SIZE
+CLUSTER_MAX_ZOOM = 16  # Deeper zooms return individual stores
+MAX_ZOOM = 22
+MAX_LATITUDE = 85.05112878  # Web Mercator cut-off
+
+
+# ========== PROJECTION ==========
+def world_pixel(lat: float, lng: float, zoom: int) -> Tuple[float, float]:
+    """Web Mercator pixel coordinates of a point at ``zoom``"""
+    scale = TILE_SIZE * (1 << zoom)
+    phi = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    x = (lng + 180.0) / 360.0 * scale
+    y = (1.0 - math.log(math.tan(phi) + 1.0 / math.cos(phi)) / math.pi) / 2.0 * scale
+    return x, y
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a tile"""
+    n = 1 << z
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
+
+
+# ========== CLUSTERS ==========
+class StoreClusters:
+    """Grid clusters of store coordinates for every zoom up to CLUSTER_MAX_ZOOM.
+
+    Each store is binned into a CELL_SIZE pixel cell at CLUSTER_MAX_ZOOM; the
+    cell at zoom z is that cell shifted right by (CLUSTER_MAX_ZOOM - z) bits,
+    so the levels nest like a quadtree. Cells keep a count and coordinate sums
+    (for the centroid), and stores are added and removed incrementally.
+    """
+
+    def __init__(self):
+        self._coords: Dict[int, Tuple[float, float]] = {}
+        self._leaf: Dict[int, Tuple[int, int]] = {}
+        # zoom -> cell -> [count, sum of lat, sum of lng, sum of ids]
+        self.levels: List[Dict[Tuple[int, int], List]] = [{} for _ in range(CLUSTER_MAX_ZOOM + 1)]
+
+    def _update(self, store_id: int, lat: float, lng: float, leaf: Tuple[int, int], sign: int):
+        for zoom, cells in enumerate(self.levels):
+            shift = CLUSTER_MAX_ZOOM - zoom
+            cell = (leaf[0] >> shift, leaf[1] >> shift)
+            totals = cells.get(cell)
+            if totals is None:
+                totals = cells[cell] = [0, 0.0, 0.0, 0]
+            totals[0] += sign
+            totals[1] += sign * lat
+            totals[2] += sign * lng
+            totals[3] += sign * store_id  # With one store left, this is its id
+            if totals[0] == 0:
+                del cells[cell]
+
+    def add(self, store_id: int, lat: float, lng: float):
+        px, py = world_pixel(lat, lng, CLUSTER_MAX_ZOOM)
+        leaf = (int(px // CELL_SIZE), int(py // CELL_SIZE))
+        self._coords[store_id] = (lat, lng)
+        self._leaf[store_id] = leaf
+        self._update(store_id, lat, lng, leaf, 1)
+
+    def remove(self, store_id: int):
+        coords = self._coords.pop(store_id, None)
+        if coords is None:
+            return
+        self._update(store_id, coords[0], coords[1], self._leaf.pop(store_id), -1)
+
+    def sync(self, coords: Dict[int, Tuple[float, float]]) -> int:
+        """Bring the clusters in line with ``coords``; returns how many stores changed"""
+        changed = 0
+        for store_id in list(self._coords):
+            if coords.get(store_id) != self._coords[store_id]:
+                self.remove(store_id)
+                changed += 1
+        for store_id, (lat, lng) in coords.items():
+            if store_id not in self._coords:
+                self.add(store_id, lat, lng)
+                changed += 1
+        return changed
+
+    def tile(self, z: int, x: int, y: int) -> Tuple[List[Dict], List[int]]:
+        """(clusters, ids of single stores) in a tile at z <= CLUSTER_MAX_ZOOM"""
+        cells = self.levels[z]
+        clusters, singles = [], []
+        for cx in range(x * CELLS_PER_TILE, (x + 1) * CELLS_PER_TILE):
+            for cy in range(y * CELLS_PER_TILE, (y + 1) * CELLS_PER_TILE):
+                totals = cells.get((cx, cy))
+                if totals is None:
+                    continue
+                count, sum_lat, sum_lng, sum_ids = totals
+                if count == 1:
+                    singles.append(sum_ids)
+                    continue
+                clusters.append({
+                    "latitude": round(sum_lat / count, 6),
+                    "longitude": round(sum_lng / count, 6),
+                    "count": count,
+                })
+        return clusters, singles
+
+
+def _store_coords(data: StoreData) -> Dict[int, Tuple[float, float]]:
+    return {
+        row["id"]: (row["lat"], row["lng"])
+        for row in data.rows
+        if row["lat"] is not None and row["lng"] is not None
+    }
+
+
+# Rebuild activity since startup (exported on /metrics); builds are serialized by DerivedCache
+counters = {"rebuilds": 0, "stores_updated": 0}
+
+
+def cluster_stats() -> Dict[str, int]:
+    return dict(counters)
+
+
+def _build_clusters(data: StoreData, previous: Optional[Dict]) -> Dict:
+    # Reuse last version's clusters so only added/moved/removed stores are touched
+    clusters = previous["clusters"] if previous else StoreClusters()
+    counters["stores_updated"] += clusters.sync(_store_coords(data))
+    counters["rebuilds"] += 1
+    return {"clusters": clusters, "rows": {row["id"]: row for row in data.rows}}
+
+
+store_clusters = DerivedCache(_build_clusters)
+
+
+def _marker(row: Dict) -> Dict:
+    return {"id": row["id"], "name": row["name"], "latitude": row["lat"], "longitude": row["lng"]}
+
+
+def get_tile(z: int, x: int, y: int) -> Dict:
+    """Cluster centroids with counts for a map tile, or its individual stores at high zoom"""
+    if z > CLUSTER_MAX_ZOOM:
+        table = store_table.get()
+        rows = table.records(table.bbox_indices(*tile_bounds(z, x, y)))
+        # Bounds are inclusive; keep edge stores in the one tile their pixel falls in
+        stores = [
+            _marker(row) for row in rows
+            if tuple(int(p // TILE_SIZE) for p in world_pixel(row["lat"], row["lng"], z)) == (x, y)
+        ]
+        return {"z": z, "x": x, "y": y, "clusters": [], "stores": stores}
+
+    cached = store_clusters.get()
+    clusters, singles = cached["clusters"].tile(z, x, y)
+    rows = cached["rows"]
+    return {"z": z, "x": x, "y": y, "clusters": clusters, "stores": [_marker(rows[i]) for i in sorted(singles)]}
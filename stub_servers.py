@@ -0,0 +1,185 @@
+"""Local stand-ins for external APIs, for tests and load runs.
+
+Run: python stub_servers.py geocoder --port 8765 --latency-ms 50
+Then: GEOCODE_URL=http://127.0.0.1:8765/maps/api/geocode/json uvicorn fastapi_p3:app
+
+Or: python stub_servers.py storefinder --responses recorded/
+Then: python webscrape_p1.py --all-states --url http://127.0.0.1:8765/storefinder/index.php
+
+Or: python stub_servers.py llm --latency-ms 800 --slow-rate 0.05 --slow-ms 6000
+Then: TOGETHER_API_URL=http://127.0.0.1:8765/v1/completions uvicorn fastapi_p3:app
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class StubGeocoderHandler(BaseHTTPRequestHandler):
+    """Answers Google Geocoding API requests with deterministic coordinates.
+
+    Addresses containing "nowhere" get ZERO_RESULTS so negative caching can be
+    exercised; ``fail_rate`` injects transient 500s.
+    """
+
+    latency_s = 0.0
+    fail_rate = 0.0
+    calls = 0
+    calls_lock = threading.Lock()
+
+    def do_GET(self):
+        with self.calls_lock:
+            type(self).calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.fail_rate and random.random() < self.fail_rate:
+            self._reply(500, {"status": "UNKNOWN_ERROR"})
+            return
+
+        address = parse_qs(urlparse(self.path).query).get("address", [""])[0]
+        if not address or "nowhere" in address.lower():
+            self._reply(200, {"status": "ZERO_RESULTS", "results": []})
+            return
+
+        # Stable pseudo-random point around Kuala Lumpur for each address
+        digest = hashlib.sha256(address.lower().encode("utf-8")).digest()
+        lat = 3.0 + digest[0] / 255 * 0.3
+        lng = 101.55 + digest[1] / 255 * 0.3
+        self._reply(200, {
+            "status": "OK",
+            "results": [{"geometry": {"location": {"lat": round(lat, 6), "lng": round(lng, 6)}}}],
+        })
+
+    def _reply(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client gave up (timeout or losing hedge)
+
+    def log_message(self, format, *args):
+        pass  # Keep load runs quiet
+
+
+class StubStoreFinderHandler(StubGeocoderHandler):
+    """Replays store finder responses recorded with ``webscrape_p1.py --record``.
+
+    Each POST returns ``<responses_dir>/<state>.json``, or an empty store list
+    when there is no recording for the requested state.
+    """
+
+    responses_dir = "."
+
+    def do_POST(self):
+        with self.calls_lock:
+            type(self).calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.fail_rate and random.random() < self.fail_rate:
+            self._reply(500, {"stores": []})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        state = parse_qs(self.rfile.read(length).decode("utf-8")).get("state", [""])[0]
+        path = os.path.join(self.responses_dir, f"{os.path.basename(state)}.json")
+        if not state or not os.path.exists(path):
+            self._reply(200, {"stores": []})
+            return
+
+        with open(path, "rb") as file:
+            payload = file.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StubLLMHandler(StubGeocoderHandler):
+    """Fake Together completions API with injectable latency.
+
+    Every call sleeps ``latency_s``; a ``slow_rate`` fraction sleeps
+    ``slow_s`` instead, to reproduce tail latency for hedging tests.
+    """
+
+    slow_rate = 0.0
+    slow_s = 0.0
+    completion = " SELECT * FROM stores WHERE has_wifi = 1;"
+
+    def do_POST(self):
+        with self.calls_lock:
+            type(self).calls += 1
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        if self.slow_rate and random.random() < self.slow_rate:
+            time.sleep(self.slow_s)
+        elif self.latency_s:
+            time.sleep(self.latency_s)
+        if self.fail_rate and random.random() < self.fail_rate:
+            self._reply(500, {"error": {"message": "stub failure"}})
+            return
+        self._reply(200, {"choices": [{"text": self.completion}]})
+
+
+def start_server(handler: type, port: int = 0, latency_ms: float = 0.0, fail_rate: float = 0.0,
+                 host: str = "127.0.0.1", **options) -> ThreadingHTTPServer:
+    """Start a stub in a background thread; ``server.server_port`` has the bound port.
+
+    Extra ``options`` override handler class attributes (e.g. ``responses_dir``).
+    """
+    handler = type(handler.__name__, (handler,), {
+        "latency_s": latency_ms / 1000, "fail_rate": fail_rate, "calls": 0, **options,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=handler.__name__, daemon=True).start()
+    return server
+
+
+def stub_url(server: ThreadingHTTPServer, path: str) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}{path}"
+
+
+STUBS = {
+    "geocoder": (StubGeocoderHandler, "/maps/api/geocode/json"),
+    "storefinder": (StubStoreFinderHandler, "/storefinder/index.php"),
+    "llm": (StubLLMHandler, "/v1/completions"),
+}
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Run a local stub of an external API")
+    parser.add_argument("stub", choices=sorted(STUBS))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--responses", default=".", help="storefinder: directory of recorded <state>.json files")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="llm: fraction of calls that are slow")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="llm: latency of slow calls")
+    args = parser.parse_args(argv)
+
+    handler, path = STUBS[args.stub]
+    server = start_server(handler, args.port, args.latency_ms, args.fail_rate, responses_dir=args.responses,
+                          slow_rate=args.slow_rate, slow_s=args.slow_ms / 1000)
+    print(f"Stub {args.stub} listening on {stub_url(server, path)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from intent_parser import confident_intent, parse_intent
+from opening_hours import TIMEZONE
+
+# Monday 10:00 in Malaysia: minute 600 of the week
+MONDAY_10AM = datetime(2026, 10, 12, 10, 0, tzinfo=TIMEZONE)
+
+
+def test_open_now_after_store_name():
+    intent = parse_intent("Is McDonald's Bangsar open now?", MONDAY_10AM)
+    assert intent.names == ["bangsar"]
+    assert intent.open_at == 600
+    assert intent.unknown == []
+
+
+def test_open_now_after_location():
+    intent = parse_intent("stores in bangsar open now", MONDAY_10AM)
+    assert intent.locations == [["bangsar"]]
+    assert intent.open_at == 600
+    assert intent.unknown == []
+
+
+def test_bare_hour_after_open_at_is_a_time():
+    intent = parse_intent("stores open at 10 in kl", MONDAY_10AM)
+    assert intent.open_at == 600
+    assert intent.locations == [["kuala lumpur"]]
+
+
+def test_number_after_at_is_not_a_location():
+    for query in ("any branch at 2", "24 hours mcd at 53300"):
+        intent = parse_intent(query, MONDAY_10AM)
+        assert intent.locations == []
+        assert intent.unknown
+
+
+def test_unknown_word_is_not_confident():
+    for query in ("Is there a drive-thru in Setapak?", "list stores in Mont Kiara with parking"):
+        assert confident_intent(query) is None
+
+
+def test_or_between_locations():
+    intent = parse_intent("stores in kl or pj")
+    assert intent.locations == [["kuala lumpur", "pj"]]
+    assert intent.confidence == 1.0
+    assert parse_intent("wifi in bangsar or in setapak").locations == [["bangsar", "setapak"]]
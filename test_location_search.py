@@ -0,0 +1,11 @@
+from location_search import area_tokens
+
+
+def test_kl_alias_from_city():
+    assert area_tokens("Lot 1, Jalan Telawi, 59100 Kuala Lumpur.").split()[-1] == "kl"
+
+
+def test_klia_is_not_kl():
+    tokens = area_tokens("Kuala Lumpur International Airport, 64000 Sepang, Selangor").split()
+    assert "kl" not in tokens
+    assert "selangor" in tokens
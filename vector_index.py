@@ -0,0 +1,204 @@
+import re
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from location_search import area_tokens
+from store_cache import DerivedCache, StoreData
+
+DIM = 1024  # Hashed feature space (power of two)
+BATCH_SIZE = 256  # Rows embedded per vectorised batch
+TRIGRAM_WEIGHT = 0.3  # Character trigrams catch partial words and typos
+NAME_WEIGHT = 2.0  # Store-name words count double
+
+# Inverted-file (IVF) candidate search, used once exact search gets expensive
+ANN_MIN_SIZE = 5000
+ANN_PROBES = 8  # Nearest clusters scanned per query
+KMEANS_ITERATIONS = 6
+KMEANS_SAMPLE = 20000
+
+# Words a store's features are described with, so "coffee" finds McCafe outlets
+FEATURE_WORDS = {
+    "has_birthday_party": "birthday party parties celebration kids",
+    "has_breakfast": "breakfast morning",
+    "has_cashless": "cashless card ewallet payment",
+    "has_dessert_center": "dessert ice cream sundae",
+    "has_digital_kiosk": "kiosk self order digital",
+    "has_mccafe": "mccafe cafe coffee latte",
+    "has_wifi": "wifi internet work laptop study",
+    "has_mcdelivery": "delivery mcdelivery deliver",
+}
+HOURS_WORDS = "24 hours all night late open 24/7"
+# Row fields the embedding depends on; unchanged rows keep their vectors
+EMBEDDED_COLUMNS = ["name", "address", "operating_hours"] + list(FEATURE_WORDS)
+
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "with", "to", "of", "in", "at", "near", "for", "me", "i",
+    "is", "are", "some", "somewhere", "place", "places", "where", "which", "what", "find",
+    "show", "any", "mcdonald", "mcdonalds", "mcdonald's", "outlet", "outlets", "store", "stores",
+    "jalan", "lot", "no", "malaysia",
+}
+
+
+# ========== EMBEDDING ==========
+def _tokens(text: str) -> List[str]:
+    return [token for token in re.findall(r"[a-z0-9']+", text.lower()) if token not in STOP_WORDS]
+
+
+@lru_cache(maxsize=65536)
+def _token_terms(token: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed (indices, signed weights) of a word and its character trigrams"""
+    padded = f"^{token}$"
+    terms = [(f"w:{token}", 1.0)] + [(f"t:{padded[i:i + 3]}", TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+    hashes = [zlib.crc32(term.encode("utf-8")) for term, _ in terms]
+    indices = np.array([h & (DIM - 1) for h in hashes], dtype=np.intp)
+    weights = np.array([-w if h & (1 << 20) else w for h, (_, w) in zip(hashes, terms)], dtype=np.float32)
+    return indices, weights
+
+
+def _hashed_terms(text: str, weight: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    """(indices, signed weights) of every word and character trigram in ``text``"""
+    terms = [_token_terms(token) for token in _tokens(text)]
+    if not terms:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+    return np.concatenate([t[0] for t in terms]), np.concatenate([t[1] for t in terms]) * weight
+
+
+def store_text(row: Dict) -> Tuple[str, str]:
+    """(name, description) embedded for a store row"""
+    words = [row.get("address") or "", area_tokens(row.get("address"))]
+    words.extend(text for column, text in FEATURE_WORDS.items() if row.get(column))
+    if "24 Hours" in str(row.get("operating_hours") or ""):
+        words.append(HOURS_WORDS)
+    return row.get("name") or "", " ".join(words)
+
+
+def embed_texts(texts: List[Tuple[str, str]]) -> np.ndarray:
+    """L2-normalised hashed embeddings of (name, description) pairs, built in batches"""
+    vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+    for start in range(0, len(texts), BATCH_SIZE):
+        batch = texts[start:start + BATCH_SIZE]
+        flat, values = [], []
+        for offset, (name, description) in enumerate(batch):
+            for indices, weights in (_hashed_terms(name, NAME_WEIGHT), _hashed_terms(description)):
+                flat.append(indices + offset * DIM)
+                values.append(weights)
+        # One scatter-add for the whole batch
+        summed = np.bincount(np.concatenate(flat), np.concatenate(values), minlength=len(batch) * DIM)
+        vectors[start:start + len(batch)] = summed.reshape(len(batch), DIM)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+def embed_query(query: str) -> np.ndarray:
+    indices, weights = _hashed_terms(query)
+    vector = np.bincount(indices, weights, minlength=DIM).astype(np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-9)
+
+
+def _row_key(row: Dict) -> Tuple:
+    return tuple(row.get(column) for column in EMBEDDED_COLUMNS)
+
+
+# ========== INDEX ==========
+class VectorIndex:
+    """Store embeddings with exact search for small sets and IVF candidates for large ones"""
+
+    def __init__(self, rows: List[Dict], previous: Optional["VectorIndex"] = None):
+        self.rows = rows
+        self.keys = [_row_key(row) for row in rows]
+
+        # Incremental: only new stores and stores whose embedded fields changed are re-embedded
+        previous_rows = dict(zip(previous.keys, range(len(previous.keys)))) if previous is not None else {}
+        positions = [previous_rows.get(key, -1) for key in self.keys]
+        stale = [i for i, position in enumerate(positions) if position < 0]
+        kept = [i for i, position in enumerate(positions) if position >= 0]
+        self.vectors = np.zeros((len(rows), DIM), dtype=np.float32)
+        if kept:
+            self.vectors[kept] = previous.vectors[[positions[i] for i in kept]]
+        if stale:
+            self.vectors[stale] = embed_texts([store_text(rows[i]) for i in stale])
+        self.embedded = len(stale)
+
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        if len(rows) >= ANN_MIN_SIZE:
+            self._build_ivf(previous)
+
+    def _build_ivf(self, previous: Optional["VectorIndex"]):
+        # Spherical k-means on a sample, then every store goes into its nearest cluster's list
+        n_lists = int(np.sqrt(len(self.rows)))
+        if previous is not None and previous._centroids is not None and len(previous._centroids) == n_lists:
+            centroids = previous._centroids  # Small refreshes keep the clustering
+        else:
+            centroids = self._kmeans(n_lists)
+
+        assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        self._centroids = centroids
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+
+    def _kmeans(self, n_lists: int) -> np.ndarray:
+        rng = np.random.default_rng(0)
+        sample = self.vectors[rng.choice(len(self.rows), min(len(self.rows), KMEANS_SAMPLE), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            sizes = np.bincount(assignment, minlength=n_lists)
+            starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+            sums = np.add.reduceat(sample[order], np.minimum(starts, len(sample) - 1), axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their old centroid
+            centroids = np.where((sizes[:, None] > 0) & (norms > 0), sums / np.maximum(norms, 1e-9), centroids)
+        return centroids
+
+    def _candidates(self, vector: np.ndarray, k: int) -> Optional[np.ndarray]:
+        if self._centroids is None:
+            return None
+        probes = np.argsort(-(self._centroids @ vector))[:ANN_PROBES]
+        candidates = np.concatenate([self._lists[i] for i in probes])
+        return candidates if len(candidates) >= k else None
+
+    def search(self, query: str, k: int = 10, min_score: float = 0.0) -> List[Tuple[float, Dict]]:
+        """Top-k (cosine score, row) for a free-text query"""
+        if not self.rows:
+            return []
+        vector = embed_query(query)
+        candidates = self._candidates(vector, k)
+        if candidates is None:
+            ids = np.arange(len(self.rows))
+            scores = self.vectors @ vector
+        else:
+            ids = candidates
+            scores = self.vectors[ids] @ vector
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.rows[ids[i]]) for i in top if scores[i] > min_score]
+
+
+# Rebuild activity since startup (exported on /metrics); builds are serialized by DerivedCache
+counters = {"rebuilds": 0, "stores_embedded": 0}
+
+
+def vector_stats() -> Dict[str, int]:
+    return dict(counters)
+
+
+def build_vector_index(data: StoreData, previous: Optional[VectorIndex]) -> VectorIndex:
+    index = VectorIndex(data.rows, previous)
+    counters["stores_embedded"] += index.embedded
+    counters["rebuilds"] += 1
+    return index
+
+
+store_vectors = DerivedCache(build_vector_index)
+
+
+def semantic_search(query: str, k: int = 10, min_score: float = 0.05) -> List[Tuple[float, Dict]]:
+    """Top-k stores for a fuzzy question, without any remote call"""
+    return store_vectors.get().search(query, k, min_score)
@@ -1,71 +1,97 @@
+import argparse
+import hashlib
 import json
+import os
 import requests
 import sqlite3
-import csv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from db import DB_NAME, writer
+from export_stores import write_export
+from location_search import area_tokens, postcode_state
+from migrations import migrate
+from opening_hours import ALL_WEEK, encode_hours, format_hours, parse_hours
 
 # Database setup
-DB_NAME = "mcdonalds_stores.db"
 CSV_FILE = "mcdonalds_stores.csv"
 
 def create_database():
     """Creates the stores table if it doesn't exist with additional columns."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS stores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            address TEXT,
-            lat TEXT,
-            lng TEXT,
-            operating_hours TEXT,
-            waze_link TEXT,
-            telephone TEXT,
-            email TEXT,
-            has_birthday_party INTEGER DEFAULT 0,
-            has_breakfast INTEGER DEFAULT 0,
-            has_cashless INTEGER DEFAULT 0,
-            has_dessert_center INTEGER DEFAULT 0,
-            has_digital_kiosk INTEGER DEFAULT 0,
-            has_mccafe INTEGER DEFAULT 0,
-            has_wifi INTEGER DEFAULT 0,
-            has_mcdelivery INTEGER DEFAULT 0,
-            UNIQUE(name, address)  -- Prevents duplicate stores
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with writer(DB_NAME) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stores (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                address TEXT,
+                lat TEXT,
+                lng TEXT,
+                operating_hours TEXT,
+                waze_link TEXT,
+                telephone TEXT,
+                email TEXT,
+                has_birthday_party INTEGER DEFAULT 0,
+                has_breakfast INTEGER DEFAULT 0,
+                has_cashless INTEGER DEFAULT 0,
+                has_dessert_center INTEGER DEFAULT 0,
+                has_digital_kiosk INTEGER DEFAULT 0,
+                has_mccafe INTEGER DEFAULT 0,
+                has_wifi INTEGER DEFAULT 0,
+                has_mcdelivery INTEGER DEFAULT 0,
+                UNIQUE(name, address)  -- Prevents duplicate stores
+            )
+        ''')
+
+        # Columns/tables added after the first release
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(stores)")}
+        if "content_hash" not in columns:
+            cursor.execute("ALTER TABLE stores ADD COLUMN content_hash TEXT")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS store_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                store_id INTEGER NOT NULL,
+                name TEXT,
+                address TEXT,
+                change_type TEXT NOT NULL CHECK (change_type IN ('added', 'updated', 'removed')),
+                changed_fields TEXT,  -- JSON list of column names
+                old_hash TEXT,
+                new_hash TEXT,
+                old_values TEXT,  -- JSON row as it was before an update or removal
+                changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_store_changes_store ON store_changes(store_id)")
+
+    # Typed coordinates, derived feature columns and indexes (see migrations.py)
+    migrate(DB_NAME)
 
 def store_data(name, address, lat, lng, operating_hours, waze_link, telephone, email,
                has_birthday_party, has_breakfast, has_cashless, 
                has_dessert_center, has_digital_kiosk, has_mccafe, 
-               has_wifi, has_mcdelivery):
+               has_wifi, has_mcdelivery, weekly_hours=None):
     """Inserts store data into the database, avoiding duplicates."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
     try:
-        cursor.execute('''
-            INSERT INTO stores (
+        with writer(DB_NAME) as conn:
+            conn.execute('''
+                INSERT INTO stores (
+                    name, address, lat, lng, operating_hours, waze_link,
+                    telephone, email, has_birthday_party, has_breakfast,
+                    has_cashless, has_dessert_center, has_digital_kiosk,
+                    has_mccafe, has_wifi, has_mcdelivery, weekly_hours, area
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
                 name, address, lat, lng, operating_hours, waze_link,
                 telephone, email, has_birthday_party, has_breakfast,
                 has_cashless, has_dessert_center, has_digital_kiosk,
-                has_mccafe, has_wifi, has_mcdelivery
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            name, address, lat, lng, operating_hours, waze_link,
-            telephone, email, has_birthday_party, has_breakfast,
-            has_cashless, has_dessert_center, has_digital_kiosk,
-            has_mccafe, has_wifi, has_mcdelivery
-        ))
-        conn.commit()
+                has_mccafe, has_wifi, has_mcdelivery, weekly_hours, area_tokens(address)
+            ))
         print(f"Store -> {name}, {address}")
     except sqlite3.IntegrityError:
         print(f"Skipped (Duplicate) -> {name}, {address}")
 
-    conn.close()
-
 # API Endpoint & Headers
 url = "https://www.mcdonalds.com.my/storefinder/index.php"
 headers = {
@@ -89,105 +115,304 @@ payload = {
     "islocateus": "0"
 }
 
-# Create the database before fetching data
-create_database()
+# States and federal territories accepted by the store finder
+MALAYSIAN_STATES = [
+    "Johor", "Kedah", "Kelantan", "Kuala Lumpur", "Labuan", "Melaka",
+    "Negeri Sembilan", "Pahang", "Perak", "Perlis", "Pulau Pinang",
+    "Putrajaya", "Sabah", "Sarawak", "Selangor", "Terengganu"
+]
 
-response = requests.post(url, headers=headers, data=payload)
+# Store finder category -> stores column
+CATEGORY_COLUMNS = {
+    "Birthday Party": "has_birthday_party",
+    "Breakfast": "has_breakfast",
+    "Cashless Facility": "has_cashless",
+    "Dessert Center": "has_dessert_center",
+    "Digital Order Kiosk": "has_digital_kiosk",
+    "McCafe": "has_mccafe",
+    "WiFi": "has_wifi",
+    "McDelivery": "has_mcdelivery",
+}
 
-if response.status_code == 200:
-    json_data = response.text.lstrip("\ufeff")  # Remove BOM if present
-    stores_data = json.loads(json_data)  # Convert text to JSON
+STORE_ROW_COLUMNS = [
+    "name", "address", "lat", "lng", "operating_hours", "waze_link",
+    "telephone", "email", "has_birthday_party", "has_breakfast",
+    "has_cashless", "has_dessert_center", "has_digital_kiosk",
+    "has_mccafe", "has_wifi", "has_mcdelivery", "weekly_hours"
+]
 
-    stores_list = stores_data.get("stores", [])  # Get list of stores
+# Store finder fields that may carry per-day hours, most specific first
+HOURS_FIELDS = ["opening_hours", "operating_hours", "op_hours", "hours"]
 
-    if not stores_list:
-        print("No stores found.")
+def parse_store(store: Dict) -> Tuple:
+    """Turns one store finder record into a row matching STORE_ROW_COLUMNS."""
+    name = store.get("name", "N/A")
+    address = store.get("address", "N/A")
+    lat = store.get("lat", "N/A")
+    lng = store.get("lng", "N/A")
+    telephone = store.get("telephone", "N/A")
+    email = store.get("email", "N/A")
+
+    # Initialize operating hours and all features
+    operating_hours = "N/A"
+    features = dict.fromkeys(CATEGORY_COLUMNS.values(), 0)
+
+    # Check categories
+    categories = store.get("cat", [])
+    for cat in categories:
+        cat_name = cat.get("cat_name", "")
+        if cat_name == "24 Hours":
+            operating_hours = "24 Hours"
+        elif cat_name in CATEGORY_COLUMNS:
+            features[CATEGORY_COLUMNS[cat_name]] = 1
+
+    # Per-day hours when the record has them; the "24 Hours" category otherwise
+    weekly = parse_hours(next((store[field] for field in HOURS_FIELDS if store.get(field)), None))
+    if weekly is None and operating_hours == "24 Hours":
+        weekly = ALL_WEEK
+    if weekly is not None:
+        operating_hours = format_hours(weekly)
+
+    # Generate Waze link
+    waze_link = f"https://waze.com/ul?ll={lat},{lng}" if lat != "N/A" and lng != "N/A" else "Location not available"
+
+    return (name, address, lat, lng, operating_hours, waze_link, telephone, email) + tuple(features.values()) \
+        + (encode_hours(weekly),)
+
+def content_hash(row: Tuple) -> str:
+    """Stable fingerprint of a parsed store row."""
+    return hashlib.sha256(json.dumps([str(value) for value in row]).encode("utf-8")).hexdigest()
+
+def same_value(old, new) -> bool:
+    """Compare a stored and a scraped value; numbers compare numerically ("3.10" == 3.1)."""
+    try:
+        return float(old) == float(new)
+    except (TypeError, ValueError):
+        return str(old) == str(new)
+
+def make_session(pool_size: int) -> requests.Session:
+    """Creates an HTTP session whose connection pool fits every worker."""
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_state(session: requests.Session, state: str, endpoint: str = url,
+                replay_dir: Optional[str] = None, record_dir: Optional[str] = None) -> Optional[List[Dict]]:
+    """Fetches the raw store list for one state (or replays a recorded response); None on error."""
+    if replay_dir:
+        try:
+            with open(os.path.join(replay_dir, f"{state}.json"), encoding="utf-8") as file:
+                body = file.read()
+        except OSError as e:
+            print(f"Error replaying stores for {state}: {e}")
+            return None
     else:
-        print(f"Total Stores Fetched: {len(stores_list)}")
+        state_payload = dict(payload, state=state, address=f"{state}, Malaysia")
+        try:
+            response = session.post(endpoint, data=state_payload, timeout=30)
+        except requests.RequestException as e:
+            print(f"Error fetching stores for {state}: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"Error fetching stores for {state}: {response.status_code}")
+            return None
+        body = response.text
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+            with open(os.path.join(record_dir, f"{state}.json"), "w", encoding="utf-8") as file:
+                file.write(body)
+
+    json_data = body.lstrip("\ufeff")  # Remove BOM if present
+    try:
+        stores = json.loads(json_data).get("stores", [])
+    except (ValueError, AttributeError) as e:
+        # One bad body fails this state only (and so blocks pruning), not the whole scrape
+        print(f"Error parsing stores for {state}: {e}")
+        return None
+    if not isinstance(stores, list):
+        print(f"Error parsing stores for {state}: unexpected 'stores' value")
+        return None
+    return stores
+
+def fetch_stores(states: Iterable[str], workers: int = 8, endpoint: str = url,
+                 replay_dir: Optional[str] = None, record_dir: Optional[str] = None) -> Tuple[List[Tuple], List[str]]:
+    """Fetches all states concurrently; returns deduplicated parsed rows and the states that failed.
+
+    Neighbouring states' 10 km search areas overlap, so the same outlet can
+    come back more than once; rows are keyed on (name, address) like the
+    table's UNIQUE constraint.
+    """
+    states = list(states)
+    with make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        responses = list(pool.map(
+            lambda state: fetch_state(session, state, endpoint, replay_dir, record_dir), states
+        ))
 
+    rows = {}
+    failed = []
+    for state, stores_list in zip(states, responses):
+        if stores_list is None:
+            failed.append(state)
+            continue
+        print(f"{state}: {len(stores_list)} stores fetched")
         for store in stores_list:
-            name = store.get("name", "N/A")
-            address = store.get("address", "N/A")
-            lat = store.get("lat", "N/A")
-            lng = store.get("lng", "N/A")
-            telephone = store.get("telephone", "N/A")
-            email = store.get("email", "N/A")
-
-            # Initialize operating hours and all features
-            operating_hours = "N/A"
-            has_birthday_party = 0
-            has_breakfast = 0
-            has_cashless = 0
-            has_dessert_center = 0
-            has_digital_kiosk = 0
-            has_mccafe = 0
-            has_wifi = 0
-            has_mcdelivery = 0
-
-            # Check categories
-            categories = store.get("cat", [])
-            for cat in categories:
-                cat_name = cat.get("cat_name", "")
-                if cat_name == "24 Hours":
-                    operating_hours = "24 Hours"
-                elif cat_name == "Birthday Party":
-                    has_birthday_party = 1
-                elif cat_name == "Breakfast":
-                    has_breakfast = 1
-                elif cat_name == "Cashless Facility":
-                    has_cashless = 1
-                elif cat_name == "Dessert Center":
-                    has_dessert_center = 1
-                elif cat_name == "Digital Order Kiosk":
-                    has_digital_kiosk = 1
-                elif cat_name == "McCafe":
-                    has_mccafe = 1
-                elif cat_name == "WiFi":
-                    has_wifi = 1
-                elif cat_name == "McDelivery":
-                    has_mcdelivery = 1
-
-            # Generate Waze link
-            waze_link = f"https://waze.com/ul?ll={lat},{lng}" if lat != "N/A" and lng != "N/A" else "Location not available"
-
-            # Store data into the database
-            store_data(
-                name, address, lat, lng, operating_hours, waze_link,
-                telephone, email, has_birthday_party, has_breakfast,
-                has_cashless, has_dessert_center, has_digital_kiosk,
-                has_mccafe, has_wifi, has_mcdelivery
-            )
+            row = parse_store(store)
+            rows.setdefault((row[0], row[1]), row)
+    return list(rows.values()), failed
+
+def bulk_store_data(rows: List[Tuple]) -> int:
+    """Inserts all rows in a single transaction, skipping duplicates; returns rows added."""
+    with writer(DB_NAME) as conn:
+        # rowcount, unlike total_changes, leaves out the derived-column trigger updates
+        cursor = conn.executemany(f'''
+            INSERT OR IGNORE INTO stores ({", ".join(STORE_ROW_COLUMNS)}, content_hash, area)
+            VALUES ({", ".join("?" * len(STORE_ROW_COLUMNS))}, ?, ?)
+        ''', [row + (content_hash(row), area_tokens(row[1])) for row in rows])
+        return cursor.rowcount
+
+def sync_stores(rows: List[Tuple], prune: bool = False, states: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """Differential sync: upserts only new/changed stores and logs every change.
+
+    Stores are matched on (name, address) and compared by content hash. With
+    ``prune``, stores missing from ``rows`` are removed; the store_changes row
+    (with the old values) is their tombstone. Given the scraped ``states``, only
+    stores whose postcode lies in one of them can be pruned. Everything runs in
+    one transaction.
+    """
+    scraped = [state.lower() for state in states] if states is not None else None
+
+    def in_scrape(address: str) -> bool:
+        if scraped is None:
+            return True
+        state = postcode_state(address)
+        return state is not None and any(name in state for name in scraped)
+
+    columns = ["id"] + STORE_ROW_COLUMNS + ["content_hash"]
+    with writer(DB_NAME) as conn:
+        # The legacy view returns coordinates as text ("3.146847"/"N/A"), like a scraped row
+        existing = {
+            (record[1], record[2]): record
+            for record in conn.execute(f"SELECT {', '.join(columns)} FROM stores_legacy")
+        }
+        inserts, updates, rehashed, changes = [], [], [], []
+        seen = set()
 
-            # Print store details
-            print(f"Stored in DB -> Store Name: {name}, Address: {address}")
+        for row in rows:
+            key = (row[0], row[1])
+            new_hash = content_hash(row)
+            seen.add(key)
+            record = existing.get(key)
+            if record is None:
+                inserts.append(row + (new_hash,))
+                continue
 
-else:
-    print(f"Error fetching stores: {response.status_code}")
+            old_values = record[1:-1]
+            old_hash = record[-1] or content_hash(old_values)
+            if old_hash == new_hash:
+                continue
+            changed = [
+                column for column, old, new in zip(STORE_ROW_COLUMNS, old_values, row)
+                if not same_value(old, new)
+            ]
+            if not changed:
+                # Same values hashed under an older row layout; refresh the hash quietly
+                rehashed.append((new_hash, record[0]))
+                continue
+            updates.append(row + (new_hash, area_tokens(row[1]), record[0]))
+            changes.append((record[0], row[0], row[1], "updated", json.dumps(changed), old_hash, new_hash,
+                            json.dumps(dict(zip(STORE_ROW_COLUMNS, old_values)))))
+
+        removed = [
+            record for key, record in existing.items() if key not in seen and in_scrape(record[2])
+        ] if prune else []
+
+        for row in inserts:
+            cursor = conn.execute(f'''
+                INSERT INTO stores ({", ".join(STORE_ROW_COLUMNS)}, content_hash, area)
+                VALUES ({", ".join("?" * len(STORE_ROW_COLUMNS))}, ?, ?)
+            ''', row + (area_tokens(row[1]),))
+            changes.append((cursor.lastrowid, row[0], row[1], "added", json.dumps(STORE_ROW_COLUMNS),
+                            None, row[-1], None))
+        conn.executemany(f'''
+            UPDATE stores SET {", ".join(f"{column} = ?" for column in STORE_ROW_COLUMNS)}, content_hash = ?, area = ?
+            WHERE id = ?
+        ''', updates)
+        conn.executemany("UPDATE stores SET content_hash = ? WHERE id = ?", rehashed)
+        conn.executemany("DELETE FROM stores WHERE id = ?", [(record[0],) for record in removed])
+        changes.extend(
+            (record[0], record[1], record[2], "removed", None, record[-1], None,
+             json.dumps(dict(zip(STORE_ROW_COLUMNS, record[1:-1]))))
+            for record in removed
+        )
+        conn.executemany('''
+            INSERT INTO store_changes (store_id, name, address, change_type, changed_fields,
+                                       old_hash, new_hash, old_values)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', changes)
+
+    return {
+        "added": len(inserts),
+        "updated": len(updates),
+        "removed": len(removed),
+        "unchanged": len(rows) - len(inserts) - len(updates),
+    }
 
 def export_to_csv():
     """Exports store data from the SQLite database to a CSV file with all new columns."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    # Fetch all data from the stores table
-    cursor.execute("SELECT * FROM stores")
-    stores = cursor.fetchall()
-
-    # Define CSV headers with all new columns
-    headers = [
-        "ID", "Name", "Address", "Latitude", "Longitude", "Operating Hours", "Waze Link",
-        "Telephone", "Email", "Birthday Party", "Breakfast", "Cashless Facility",
-        "Dessert Center", "Digital Kiosk", "McCafe", "WiFi", "McDelivery"
-    ]
-
-    # Write data to CSV
-    with open(CSV_FILE, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file)
-        writer.writerow(headers)  # Write headers
-        writer.writerows(stores)  # Write store data
-
-    conn.close()
+    # Streams the table in chunks, so memory stays flat however many stores there are
+    write_export(CSV_FILE, "csv", DB_NAME)
     print(f"Data successfully exported to {CSV_FILE}")
 
-# Run the export function
-export_to_csv()
\ No newline at end of file
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Scrape McDonald's Malaysia outlets into SQLite")
+    parser.add_argument("--state", action="append", dest="states", metavar="STATE",
+                        help="State to scrape (repeatable, default: Kuala Lumpur)")
+    parser.add_argument("--all-states", action="store_true", help="Scrape every Malaysian state")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--url", default=url, help="Store finder endpoint (e.g. a local stub)")
+    parser.add_argument("--record", metavar="DIR", help="Save each state's raw response to DIR")
+    parser.add_argument("--replay", metavar="DIR", help="Load responses recorded with --record instead of fetching")
+    parser.add_argument("--sync", action="store_true",
+                        help="Differential sync: update changed stores and log changes to store_changes")
+    parser.add_argument("--prune", action="store_true",
+                        help="With --sync, remove stores missing from the scrape (implied by --all-states)")
+    parser.add_argument("--no-export", action="store_true", help=f"Skip writing {CSV_FILE}")
+    args = parser.parse_args(argv)
+
+    states = MALAYSIAN_STATES if args.all_states else (args.states or ["Kuala Lumpur"])
+
+    # Create the database before fetching data
+    create_database()
+
+    started = time.perf_counter()
+    rows, failed = fetch_stores(states, args.workers, args.url, args.replay, args.record)
+    fetched = time.perf_counter()
+    if not rows:
+        print("No stores found.")
+        return
+
+    print(f"Total Stores Fetched: {len(rows)} unique across {len(states)} state(s)")
+    if args.sync:
+        # Never prune on a partial scrape, or every store in a failed state would vanish
+        prune = (args.prune or args.all_states) and not failed
+        if failed:
+            print(f"Not pruning: failed to fetch {', '.join(failed)}")
+        # A partial scrape only prunes the states it covered
+        stats = sync_stores(rows, prune=prune, states=None if args.all_states else states)
+        print(f"Synced DB -> {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['removed']} removed, {stats['unchanged']} unchanged")
+    else:
+        inserted = bulk_store_data(rows)
+        print(f"Stored in DB -> {inserted} new, {len(rows) - inserted} skipped (duplicate)")
+    finished = time.perf_counter()
+    print(f"Fetch {fetched - started:.2f}s, insert {finished - fetched:.2f}s, "
+          f"{len(rows) / (finished - started):.0f} stores/s")
+
+    if not args.no_export:
+        export_to_csv()
+
+if __name__ == "__main__":
+    main()